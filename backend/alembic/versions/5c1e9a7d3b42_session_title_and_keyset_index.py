@@ -0,0 +1,59 @@
+"""Session title column and keyset index
+
+Revision ID: 5c1e9a7d3b42
+Revises: 22b133b00cef
+Create Date: 2026-10-17 09:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e9a7d3b42'
+down_revision: Union[str, None] = '22b133b00cef'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_sessions', sa.Column('title', sa.String(), nullable=True))
+
+    # Backfill titles from each session's first user message
+    op.execute("""
+        UPDATE chat_sessions s SET title = (
+            SELECT CASE WHEN length(m.content) > 50 THEN substr(m.content, 1, 50) || '...' ELSE m.content END
+            FROM chat_messages m
+            WHERE m.session_id = s.id AND m.role = 'user'
+            ORDER BY m.created_at ASC, m.id ASC
+            LIMIT 1
+        )
+        WHERE s.title IS NULL
+    """)
+
+    # updated_at was only set by ORM updates, so most rows are NULL: use last activity
+    op.execute("""
+        UPDATE chat_sessions s SET updated_at = COALESCE(
+            (SELECT max(m.created_at) FROM chat_messages m WHERE m.session_id = s.id),
+            s.created_at,
+            now()
+        )
+        WHERE s.updated_at IS NULL
+    """)
+    op.alter_column('chat_sessions', 'updated_at',
+               existing_type=sa.DateTime(timezone=True),
+               server_default=sa.text('now()'),
+               nullable=False)
+
+    op.create_index('ix_chat_sessions_user_id_updated_at_id', 'chat_sessions', ['user_id', 'updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_sessions_user_id_updated_at_id', table_name='chat_sessions')
+    op.alter_column('chat_sessions', 'updated_at',
+               existing_type=sa.DateTime(timezone=True),
+               server_default=None,
+               nullable=True)
+    op.drop_column('chat_sessions', 'title')
@@ -0,0 +1,30 @@
+"""Document size and sha256
+
+Revision ID: b7e3c9a15f20
+Revises: 8d4f2b6e1a97
+Create Date: 2026-10-17 11:26:05.340871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c9a15f20'
+down_revision: Union[str, None] = '8d4f2b6e1a97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('size_bytes', sa.BigInteger(), nullable=True))
+    op.add_column('documents', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_documents_sha256'), 'documents', ['sha256'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_documents_sha256'), table_name='documents')
+    op.drop_column('documents', 'sha256')
+    op.drop_column('documents', 'size_bytes')
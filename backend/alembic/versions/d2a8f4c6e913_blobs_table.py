@@ -0,0 +1,53 @@
+"""Reference-counted blobs shared by documents
+
+Revision ID: d2a8f4c6e913
+Revises: b7e3c9a15f20
+Create Date: 2026-10-17 12:41:52.907316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a8f4c6e913'
+down_revision: Union[str, None] = 'b7e3c9a15f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=True),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('index_doc_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+
+    # Existing hashed uploads were each indexed under their own document id; the blob
+    # adopts an indexed one, and deleting the others still removes their own chunks.
+    op.execute("""
+        INSERT INTO blobs (sha256, path, size_bytes, ref_count, status, index_doc_id)
+        SELECT sha256,
+               min(s3_key),
+               max(size_bytes),
+               count(*),
+               CASE WHEN bool_or(status = 'indexed') THEN 'indexed' ELSE 'pending' END,
+               COALESCE(min(id) FILTER (WHERE status = 'indexed'), min(id))
+        FROM documents
+        WHERE sha256 IS NOT NULL
+        GROUP BY sha256
+    """)
+
+    op.create_foreign_key('fk_documents_sha256_blobs', 'documents', 'blobs', ['sha256'], ['sha256'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('fk_documents_sha256_blobs', 'documents', type_='foreignkey')
+    op.drop_table('blobs')
@@ -0,0 +1,34 @@
+"""Ingestion progress columns on documents
+
+Revision ID: e5b1d7f3a2c8
+Revises: d2a8f4c6e913
+Create Date: 2026-10-17 15:02:31.448120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b1d7f3a2c8'
+down_revision: Union[str, None] = 'd2a8f4c6e913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('pages_total', sa.Integer(), nullable=True))
+    op.add_column('documents', sa.Column('pages_processed', sa.Integer(), nullable=True))
+    op.add_column('documents', sa.Column('chunks_indexed', sa.Integer(), nullable=True))
+    op.add_column('documents', sa.Column('processing_started_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('documents', sa.Column('progress_updated_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('documents', 'progress_updated_at')
+    op.drop_column('documents', 'processing_started_at')
+    op.drop_column('documents', 'chunks_indexed')
+    op.drop_column('documents', 'pages_processed')
+    op.drop_column('documents', 'pages_total')
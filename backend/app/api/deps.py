@@ -8,6 +8,7 @@ from app.db.session import get_db
 from app.core import security
 from app.core.config import settings
 from app.db.models import User
+from app.core.principals import Principal, principal_cache
 from sqlalchemy.future import select
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/login/access-token")
@@ -17,7 +18,7 @@ class TokenData(BaseModel):
 
 async def get_current_user(
     db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> User:
+) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -34,8 +35,21 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    result = await db.execute(select(User).where(User.id == int(token_data.username)))
-    user = result.scalars().first()
-    if user is None:
+    try:
+        user_id = int(token_data.username)
+    except ValueError:
         raise credentials_exception
-    return user
+
+    # Most requests are served from the principal cache without touching Postgres
+    principal = await principal_cache.get(user_id, token)
+    if principal is None:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalars().first()
+        if user is None:
+            raise credentials_exception
+        principal = Principal.from_user(user)
+        await principal_cache.set(token, principal)
+
+    if not principal.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user")
+    return principal
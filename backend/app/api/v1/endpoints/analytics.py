@@ -5,13 +5,14 @@ from sqlalchemy import func
 from app.api import deps
 from app.db.session import get_db
 from app.db.models import Document, ChatSession, ChatMessage
+from app.core.principals import Principal
 
 router = APIRouter()
 
 @router.get("/stats")
 async def get_stats(
     db: AsyncSession = Depends(get_db),
-    current_user = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_user)
 ):
     # Total Documents
     result = await db.execute(select(func.count(Document.id)).where(Document.owner_id == current_user.id))
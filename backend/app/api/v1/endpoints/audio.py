@@ -4,6 +4,7 @@ import os
 import tempfile
 from openai import OpenAI
 from app.core.config import settings
+from app.core.executors import run_io, run_vendor
 
 router = APIRouter()
 
@@ -18,19 +19,23 @@ async def transcribe_audio(file: UploadFile = File(...)):
     if not suffix:
         suffix = ".webm" # Default for browser recording
         
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
+    def _spool() -> str:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+            shutil.copyfileobj(file.file, tmp)
+            return tmp.name
 
-    try:
+    tmp_path = await run_io(_spool)
+
+    def _transcribe():
         client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        
         with open(tmp_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
+            return client.audio.transcriptions.create(
                 model="whisper-1", 
                 file=audio_file
             )
-            
+
+    try:
+        transcription = await run_vendor(_transcribe)
         return {"text": transcription.text}
         
     except Exception as e:
@@ -40,4 +45,4 @@ async def transcribe_audio(file: UploadFile = File(...)):
     finally:
         # Cleanup
         if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+            await run_io(os.unlink, tmp_path)
@@ -1,17 +1,31 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+import asyncio
+import base64
+from contextlib import aclosing
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import tuple_
 from sqlalchemy.future import select
 
 from app.api import deps
-from app.db.session import get_db, AsyncSessionLocal
-from app.db.models import User, ChatSession, ChatMessage
+from app.db.session import get_db
+from app.db.models import ChatSession
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.core.principals import Principal
+from app.core.sse import EventStream, SSE_HEADERS
 from app.rag.retrieval import chat_stream
+from app.services.chat_history import load_history, append_message
+from app.services.message_buffer import message_buffer
 
 router = APIRouter()
 
+PARTIAL_ANSWER_MARKER = "\n\n_[response interrupted]_"
+
 class ChatRequest(BaseModel):
     session_id: Optional[int] = None
     message: str
@@ -20,18 +34,52 @@ class ChatResponse(BaseModel):
     session_id: int
     message: str
 
-async def save_bot_message_background(session_id: int, message_content: str):
-    async with AsyncSessionLocal() as db:
-        msg = ChatMessage(role="assistant", content=message_content, session_id=session_id)
-        db.add(msg)
-        await db.commit()
+def session_title(message: str) -> str:
+    return message[:50] + "..." if len(message) > 50 else message
+
+def encode_cursor(updated_at: datetime, session_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{updated_at.isoformat()}|{session_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        updated_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(updated_at), int(session_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def save_message(session_id: int, role: str, content: str, new_session: bool = False):
+    # Queued for a batched insert; the history window is updated right away
+    await message_buffer.add_message(session_id, role, content)
+    await append_message(session_id, role, content, create=new_session)
+
+async def client_disconnected(http_request: Request) -> None:
+    """
+    Completes when the client closes the connection (the request body is already read).
+    """
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+async def save_partial_answer(session_id: int, answer: str):
+    """
+    An answer whose client disconnected mid-stream, kept per CHAT_PARTIAL_ANSWER_POLICY.
+    """
+    policy = settings.CHAT_PARTIAL_ANSWER_POLICY
+    metrics.incr("chat.abandoned")
+    if not answer:
+        metrics.incr("chat.abandoned_before_answer")
+    logger.info("chat_abandoned", session_id=session_id, answer_chars=len(answer), policy=policy)
+    if not answer.strip() or policy == "discard":
+        return
+    if policy == "mark":
+        answer += PARTIAL_ANSWER_MARKER
+    await save_message(session_id, "assistant", answer)
 
 @router.post("/message")
 async def chat_message(
     request: ChatRequest,
-    background_tasks: BackgroundTasks,
+    http_request: Request,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_user)
 ):
     # 1. Get or Create Session
     if request.session_id:
@@ -40,87 +88,75 @@ async def chat_message(
         if not session:
              raise HTTPException(status_code=404, detail="Session not found")
     else:
-        session = ChatSession(user_id=current_user.id)
+        session = ChatSession(user_id=current_user.id, title=session_title(request.message))
         db.add(session)
         await db.commit()
         await db.refresh(session)
         
-    # 2. Get History (Last 10 messages)
-    result = await db.execute(
-        select(ChatMessage)
-        .where(ChatMessage.session_id == session.id)
-        .order_by(ChatMessage.created_at.desc())
-        .limit(10)
-    )
-    messages = result.scalars().all()
-    history = [(m.content, "") if m.role == "user" else ("", m.content) for m in reversed(messages)]
+    # 2. Get History (token-budgeted window, usually straight from Redis)
+    history = await load_history(db, session.id) if request.session_id else []
     
-    # 3. Save User Message
-    user_msg = ChatMessage(role="user", content=request.message, session_id=session.id)
-    db.add(user_msg)
-    await db.commit()
+    # 3. Save User Message (also bumps the session's updated_at)
+    await save_message(session.id, "user", request.message, new_session=not request.session_id)
 
-    # 4. Stream Response & Accumulate for Persistence
+    # 4. Stream Response (as SSE events) & Accumulate for Persistence
     async def generate():
-        full_response = ""
-        async for token in chat_stream(request.message, history):
-            # Check if token contains the JSON metadata line
-            # This is a bit brittle if the JSON is split across tokens, 
-            # but given our generator yields the full JSON line first, it should be safe.
-            if token.startswith('{"type": "sources"'):
-                 # It's the metadata chunk, yield it but don't save to DB text
-                 yield token
-                 continue
-            
-            full_response += token
-            yield token
+        answer = []
+        try:
+            async with aclosing(chat_stream(request.message, history, owner_id=current_user.id)) as events:
+                async for event, data in events:
+                    if event == "token":
+                        answer.append(data)
+                    yield event, data
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away: the pipeline (LLM stream, rerank, web search, cache
+            # write) was cancelled with this generator
+            await save_partial_answer(session.id, "".join(answer))
+            raise
         
-        await save_bot_message_background(session.id, full_response)
+        await save_message(session.id, "assistant", "".join(answer))
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return StreamingResponse(
+        EventStream(generate(), done={"session_id": session.id}, disconnected=client_disconnected(http_request)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 @router.get("/sessions", response_model=List[ChatResponse])
 async def get_chat_sessions(
-    skip: int = 0,
-    limit: int = 20,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_user)
 ):
     """
-    Retrieve chat sessions for the current user.
+    Retrieve chat sessions for the current user, most recently active first.
+
+    Keyset-paginated on (updated_at, id): pass the `X-Next-Cursor` response header
+    back as `cursor` to get the next page (no header = last page). `skip` (offset
+    paging) still works without a cursor for older clients, but is deprecated.
     """
-    # Create a result model that fits the response
-    # We might need a better response model for sessions listing
-    # For now reusing ChatResponse or creating a new one
-    
-    # Fetch sessions with pagination
-    result = await db.execute(
-        select(ChatSession)
+    query = (
+        select(ChatSession.id, ChatSession.title, ChatSession.updated_at)
         .where(ChatSession.user_id == current_user.id)
-        .order_by(ChatSession.updated_at.desc())
-        .offset(skip)
-        .limit(limit)
+        .order_by(ChatSession.updated_at.desc(), ChatSession.id.desc())
+        .limit(limit + 1)
     )
-    sessions = result.scalars().all()
-    
-    response_data = []
-    for s in sessions:
-        # Fetch first user message for title
-        # Optimized: query only the first message content
-        msg_result = await db.execute(
-            select(ChatMessage.content)
-            .where(ChatMessage.session_id == s.id, ChatMessage.role == "user")
-            .order_by(ChatMessage.created_at.asc())
-            .limit(1)
-        )
-        first_msg = msg_result.scalar_one_or_none()
-        
-        # Truncate title
-        title = first_msg[:50] + "..." if first_msg and len(first_msg) > 50 else (first_msg or f"Conversation {s.id}")
-        
-        response_data.append({
-            "session_id": s.id,
-            "message": title
-        })
-    
-    return response_data
+    if cursor:
+        updated_at, session_id = decode_cursor(cursor)
+        query = query.where(tuple_(ChatSession.updated_at, ChatSession.id) < tuple_(updated_at, session_id))
+    elif skip:
+        query = query.offset(skip)
+
+    rows = (await db.execute(query)).all()
+    page = rows[:limit]
+    if len(rows) > limit:
+        last = page[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.updated_at, last.id)
+
+    return [
+        {"session_id": row.id, "message": row.title or f"Conversation {row.id}"}
+        for row in page
+    ]
@@ -1,10 +1,12 @@
+import os
 from typing import List
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.api import deps
 from app.db.session import get_db
-from app.db.models import Document, User
+from app.db.models import Document
+from app.core.principals import Principal
 from app.services import document_service
 
 router = APIRouter()
@@ -13,7 +15,7 @@ router = APIRouter()
 async def upload_document(
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_user)
 ):
     if not file.filename.endswith(('.txt', '.pdf', '.docx', '.md')):
         raise HTTPException(status_code=400, detail="File type not supported")
@@ -24,7 +26,7 @@ async def upload_document(
 @router.get("/", response_model=List[dict])
 async def list_documents(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_user)
 ):
     result = await db.execute(select(Document).where(Document.owner_id == current_user.id))
     documents = result.scalars().all()
@@ -34,14 +36,32 @@ async def list_documents(
         "filename": d.filename, 
         "status": d.status, 
         "created_at": d.created_at,
-        "preview_url": f"/static/uploads/{d.owner_id}_{d.filename}"
+        "size_bytes": d.size_bytes,
+        "sha256": d.sha256,
+        "preview_url": f"/static/uploads/{os.path.basename(d.s3_key)}",
+        "progress": document_service.ingestion_progress(d),
     } for d in documents]
 
+@router.put("/{doc_id}", response_model=dict)
+async def replace_document(
+    doc_id: int,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_user)
+):
+    if not file.filename.endswith(('.txt', '.pdf', '.docx', '.md')):
+        raise HTTPException(status_code=400, detail="File type not supported")
+
+    document = await document_service.replace_document(doc_id, file, current_user, db)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"id": document.id, "filename": document.filename, "status": document.status}
+
 @router.delete("/{doc_id}")
 async def delete_document(
     doc_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_user)
 ):
     success = await document_service.delete_document(doc_id, current_user, db)
     if not success:
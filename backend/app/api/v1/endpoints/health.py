@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from app.db.session import get_db
+from app.db.session import get_db, pool_status
 from app.core.config import settings
 from app.core.logging import logger
+from app.core.metrics import metrics
+from app.rag.resources import resources
 import redis.asyncio as redis
 
 router = APIRouter()
@@ -16,7 +18,11 @@ async def health_check(db: AsyncSession = Depends(get_db)):
     health_status = {
         "status": "ok",
         "database": "unknown",
-        "redis": "unknown"
+        "redis": "unknown",
+        "resources": resources.status(),
+        "warm": resources.is_warm(),
+        "db_pool": pool_status(),
+        "metrics": metrics.snapshot()
     }
 
     # Check Database
@@ -7,6 +7,7 @@ from sqlalchemy.future import select
 
 from app.api import deps
 from app.core import security
+from app.core.executors import run_cpu
 from app.db.session import get_db
 from app.db.models import User
 
@@ -22,7 +23,7 @@ async def login_access_token(
     result = await db.execute(select(User).where(User.email == form_data.username))
     user = result.scalars().first()
     
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    if not user or not await run_cpu(security.verify_password, form_data.password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     
     access_token_expires = timedelta(minutes=60)
@@ -6,6 +6,7 @@ from sqlalchemy.future import select
 
 from app.api import deps
 from app.core import security
+from app.core.executors import run_cpu
 from app.db.session import get_db
 from app.db.models import User
 from app.schemas import UserCreate, User as UserSchema
@@ -33,7 +34,7 @@ async def create_user_open(
     # 2. Create new user
     user = User(
         email=user_in.email,
-        hashed_password=security.get_password_hash(user_in.password),
+        hashed_password=await run_cpu(security.get_password_hash, user_in.password),
         is_active=True,
         is_superuser=False,
     )
@@ -12,6 +12,29 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     POSTGRES_HOST: str = "db"
     POSTGRES_PORT: int = 5432
+
+    # Database connection pool (0 = no pooling, a fresh connection per session)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30 # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800 # seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = True
+    # Celery workers build their own engine (after fork); their tasks share one event loop
+    WORKER_DB_POOL_SIZE: int = 5
+    WORKER_DB_MAX_OVERFLOW: int = 5
+
+    # Celery worker (app/worker.py)
+    WORKER_POOL: str = "threads" # threads: one process, concurrent tasks on a shared loop | prefork
+    WORKER_CONCURRENCY: int = 4 # documents ingested at once per worker process
+    INGEST_SPLIT_MIN_PAGES: int = 200 # PDFs with more pages are fanned out in page ranges
+    INGEST_RANGE_PAGES: int = 100 # pages per range task
+    INGEST_PRIORITY_MAX_BYTES: int = 2 * 1024 * 1024 # uploads up to this size use the priority queue
+    INGEST_MAX_ACTIVE_PER_USER: int = 2 # range tasks one user may run at once, across all workers
+    INGEST_SLOT_LEASE_TTL: int = 3600 # seconds before the slot of a task whose worker died is reclaimed
+    INGEST_FAIRNESS_RETRY_DELAY: int = 5 # seconds before a throttled range task is retried
+    INGEST_CHECKPOINT_TTL: int = 60 * 60 * 24 * 7 # seconds a resume point of an unfinished ingestion is kept
+    INGEST_PROGRESS_INTERVAL: float = 2.0 # minimum seconds between progress writes per task
+    INGEST_STALL_TIMEOUT: int = 15 * 60 # seconds without progress before an unfinished ingestion is requeued
     
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> str:
@@ -20,17 +43,122 @@ class Settings(BaseSettings):
     # ChromaDB
     CHROMA_HOST: str = "chromadb"
     CHROMA_PORT: int = 8000
-    
+
+    # RAG Resources (shared per process, see app/rag/resources.py)
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_DIMENSIONS: Optional[int] = None # None = model default
+    RANKER_MODEL: str = "ms-marco-MiniLM-L-12-v2"
+    RANKER_CACHE_DIR: str = "/app/.cache"
+    RESOURCE_HEALTH_CHECK_INTERVAL: int = 30 # seconds between background health checks
+    RESOURCE_RETRY_BACKOFF: int = 5 # seconds before retrying a resource that failed to build
+
+    # Embedding cache (app/rag/embedding_cache.py): local | redis | none
+    EMBEDDING_CACHE_BACKEND: str = "local"
+    EMBEDDING_CACHE_PATH: str = "/app/.cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200_000
+    EMBEDDING_CACHE_TOUCH_INTERVAL: int = 60 * 60 # local backend: seconds between recency updates of an entry
+    EMBEDDING_CACHE_REDIS_DB: int = 1
+    EMBEDDING_CACHE_TTL: int = 60 * 60 * 24 * 30 # Redis backend only
+
+    # Embedding scheduler (app/rag/embedding_scheduler.py)
+    EMBED_MAX_CONCURRENCY: int = 8 # upper bound for the adaptive in-flight window
+    EMBED_INITIAL_CONCURRENCY: int = 2
+    EMBED_MAX_BATCH_TOKENS: int = 100_000 # tokens per embedding request
+    EMBED_MAX_BATCH_SIZE: int = 512 # inputs per embedding request
+    EMBED_MAX_RETRIES: int = 6
+    EMBED_BASE_BACKOFF: float = 0.5 # seconds, doubled per attempt (full jitter)
+    EMBED_MAX_BACKOFF: float = 30.0
+    EMBED_TARGET_LATENCY: float = 5.0 # seconds; slower calls shrink the window by a quarter
+
+    # Ingestion pipeline (app/rag/pipeline.py)
+    INGEST_BATCH_SIZE: int = 64 # chunks per embedding request / Chroma upsert
+    INGEST_MAX_QUEUED_CHUNKS: int = 256 # parsed chunks waiting for embedding
+    INGEST_MAX_QUEUED_BATCHES: int = 2 # embedded batches waiting for upsert
+    INGEST_EMBED_CONCURRENCY: int = 4 # embedding batches in flight per document
+
+    # Hybrid retrieval (app/rag/lexical.py)
+    RETRIEVAL_K: int = 20 # candidates from each retriever
+    HYBRID_CANDIDATES: int = 10 # fused candidates passed to the reranker
+    HYBRID_RRF_K: int = 60
+    HYBRID_AGREEMENT_DEPTH: int = 3 # identical top-N from both retrievers skips reranking
+    LEXICAL_INDEX_PATH: str = "/app/.cache/lexical.sqlite3"
+    LEXICAL_MAX_DF_RATIO: float = 0.5 # ignore query terms present in more than this share of chunks
+
+    # Web-search fallback (app/rag/web_search.py)
+    WEB_SEARCH_TIMEOUT: float = 4.0 # seconds from launch before falling back to local context
+    WEB_SEARCH_CACHE_SIZE: int = 512
+    WEB_SEARCH_CACHE_TTL: int = 3600 # seconds a result is reused for the same normalized query
+    WEB_SEARCH_SPECULATE_BELOW: float = 0.3 # top vector relevance that starts the search alongside reranking
+
+    # Answer cache (app/rag/answer_cache.py)
+    ANSWER_CACHE_TTL: int = 60 * 60 * 24 # seconds, Redis and semantic tiers
+    ANSWER_CACHE_L1_SIZE: int = 1024
+    ANSWER_CACHE_L1_TTL: int = 300
+    ANSWER_CACHE_THRESHOLD: float = 0.90 # semantic tier relevance needed for a hit
+    ANSWER_CACHE_SEMANTIC_MAX_ENTRIES: int = 10_000
+    ANSWER_CACHE_PRUNE_EVERY: int = 50 # stores between semantic-tier prunes
+    ANSWER_CACHE_VERSION_TTL: float = 1.0 # seconds the corpus version is reused before re-reading it
+
+    # Single-flight answers (app/rag/single_flight.py)
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_LEASE_TTL: int = 120 # seconds a leader's claim lasts without progress
+    SINGLE_FLIGHT_REPLAY_TTL: int = 60 # seconds a finished answer stays replayable
+    SINGLE_FLIGHT_WAIT_TIMEOUT: float = 30 # seconds a follower waits for the leader's next event
+
+    # Reranking service (app/rag/reranker.py)
+    RERANK_WORKERS: int = 1 # dedicated threads running FlashRank
+    RERANK_MAX_BATCH: int = 8 # rerank requests merged into one model call
+    RERANK_MAX_WAIT_MS: int = 5 # how long the batcher waits for more requests
+    RERANK_MAX_QUEUE: int = 64 # pending requests before callers are pushed back
+    RERANK_ENQUEUE_TIMEOUT: float = 0.5 # seconds a caller waits for queue space
+
     # Redis
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
+    REDIS_CACHE_DB: int = 2 # application caches (0 is the Celery broker, 1 the embedding cache)
+    REDIS_SOCKET_TIMEOUT: float = 1.0
 
     # OpenAI
     OPENAI_API_KEY: str
+    CHAT_MODEL: str = "gpt-4o"
 
     # Security
     SECRET_KEY: str = "change-me-in-production-please-this-is-insecure-default"
 
+    # Chat history window (app/services/chat_history.py)
+    HISTORY_TOKEN_BUDGET: int = 1500 # tokens of prior turns passed to question condensation
+    HISTORY_MAX_MESSAGES: int = 20 # messages kept in the Redis window / loaded from Postgres
+    HISTORY_CACHE_TTL: int = 3600 # seconds an idle session's window stays in Redis
+
+    # Chat event stream (app/core/sse.py)
+    SSE_FLUSH_INTERVAL_MS: float = 50 # max delay of a buffered token before its frame is sent
+    SSE_FLUSH_BYTES: int = 512 # buffered token text that triggers an immediate frame
+    SSE_HEARTBEAT_INTERVAL: float = 15 # seconds of silence before a keep-alive comment
+    # What happens to an answer whose client disconnected mid-stream:
+    # discard | save (the partial text as is) | mark (saved, flagged as interrupted)
+    CHAT_PARTIAL_ANSWER_POLICY: str = "mark"
+
+    # Chat message write-behind buffer (app/services/message_buffer.py)
+    MESSAGE_BUFFER_FLUSH_SIZE: int = 100 # messages that trigger an immediate flush
+    MESSAGE_BUFFER_FLUSH_INTERVAL: float = 0.5 # seconds between periodic flushes
+    MESSAGE_BUFFER_MAX_PENDING: int = 5000 # beyond this, writes go straight to the database
+    MESSAGE_BUFFER_MAX_RETRIES: int = 5 # failed flushes of a batch before its rows are written one by one
+
+    # Uploads (app/services/upload_storage.py)
+    UPLOAD_MAX_BYTES: int = 50 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024 # bytes read/hashed/written per step
+
+    # Blocking-call executors (app/core/executors.py)
+    EXECUTOR_IO_WORKERS: int = 32
+    EXECUTOR_CPU_WORKERS: int = 4 # bcrypt hashing
+    EXECUTOR_VENDOR_WORKERS: int = 16 # OpenAI / web search SDK calls
+    LOOP_BLOCK_THRESHOLD_MS: int = 100 # log the stack of anything holding the event loop longer
+
+    # Authenticated principal cache (app/core/principals.py)
+    PRINCIPAL_CACHE_TTL: int = 300 # seconds in Redis
+    PRINCIPAL_CACHE_L1_SIZE: int = 4096
+    PRINCIPAL_CACHE_L1_TTL: int = 15 # seconds in-process; bounds staleness across processes
+
     class Config:
         case_sensitive = True
         env_file = ".env"
@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import functools
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+
+# Bounded pools per workload class, so one kind of blocking work cannot starve another:
+#   io     - file system and internal HTTP services (Chroma)
+#   cpu    - password hashing (bcrypt releases the GIL, so threads scale across cores)
+#   vendor - third-party SDK calls with long, unpredictable latency (OpenAI, web search)
+_POOL_SIZES = {
+    "io": settings.EXECUTOR_IO_WORKERS,
+    "cpu": settings.EXECUTOR_CPU_WORKERS,
+    "vendor": settings.EXECUTOR_VENDOR_WORKERS,
+}
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(kind: str) -> ThreadPoolExecutor:
+    pool = _pools.get(kind)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(kind)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=_POOL_SIZES[kind], thread_name_prefix=f"exec-{kind}")
+                _pools[kind] = pool
+    return pool
+
+
+async def _run(kind: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    # Like asyncio.to_thread: the call sees the caller's context (request id, log bindings)
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    metrics.incr(f"executor.{kind}.calls")
+    return await asyncio.get_running_loop().run_in_executor(get_pool(kind), call)
+
+
+async def run_io(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    return await _run("io", fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    return await _run("cpu", fn, *args, **kwargs)
+
+
+async def run_vendor(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    return await _run("vendor", fn, *args, **kwargs)
+
+
+def shutdown_executors() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+class LoopWatchdog:
+    """
+    Detects callbacks that hold the event loop.
+
+    A task on the loop records a heartbeat every few milliseconds; a watchdog thread
+    notices when the heartbeat goes stale for longer than the threshold and logs the
+    loop thread's current stack, i.e. the code that is blocking it.
+    """
+
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000
+        self._beat = time.monotonic()
+        self.max_lag = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        interval = self.threshold / 4
+        while True:
+            lag = time.monotonic() - self._beat - interval
+            if lag > self.max_lag:
+                self.max_lag = lag
+                metrics.set_gauge("event_loop.max_lag_ms", round(lag * 1000, 1))
+            self._beat = time.monotonic()
+            await asyncio.sleep(interval)
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or reported == beat:
+                continue
+            reported = beat # one report per stall
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=12)) if frame else ""
+            metrics.incr("event_loop.blocked")
+            logger.warning("event_loop_blocked", blocked_ms=round(stalled * 1000), stack=stack)
@@ -0,0 +1,36 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Union
+
+Number = Union[int, float]
+
+
+class Metrics:
+    """
+    Minimal thread-safe in-process counters and gauges.
+    Values are per process and reported through the health endpoint.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Number] = defaultdict(int)
+        self._gauges: Dict[str, Number] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: Number = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: Number) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name: str) -> Number:
+        with self._lock:
+            return self._counters.get(name, self._gauges.get(name, 0))
+
+    def snapshot(self) -> Dict[str, Number]:
+        with self._lock:
+            return {**self._counters, **self._gauges}
+
+
+metrics = Metrics()
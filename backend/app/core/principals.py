@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.core.redis_client import get_redis
+from app.core.ttl_cache import TTLCache
+from app.db.models import User
+
+
+class Principal:
+    """
+    The authenticated user as endpoints see it: just the fields they need,
+    detached from any database session.
+    """
+
+    def __init__(self, id: int, email: str, is_active: bool, is_superuser: bool):
+        self.id = id
+        self.email = email
+        self.is_active = is_active
+        self.is_superuser = is_superuser
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(user.id, user.email, bool(user.is_active), bool(user.is_superuser))
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"id": self.id, "email": self.email, "is_active": self.is_active, "is_superuser": self.is_superuser}
+        )
+
+    @classmethod
+    def from_json(cls, raw: str) -> "Principal":
+        return cls(**json.loads(raw))
+
+
+class PrincipalCache:
+    """
+    Principals by (user id, token): a short-TTL in-process LRU in front of Redis.
+
+    Redis keeps one hash per user (field = token digest), so invalidating a user
+    is a single DEL. Other processes' in-process entries age out after
+    PRINCIPAL_CACHE_L1_TTL, which bounds how long a deactivated user stays signed in.
+    """
+
+    def __init__(self):
+        self._local = TTLCache(settings.PRINCIPAL_CACHE_L1_SIZE, settings.PRINCIPAL_CACHE_L1_TTL)
+
+    @staticmethod
+    def _redis_key(user_id: int) -> str:
+        return f"principal:{user_id}"
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+
+    async def get(self, user_id: int, token: str) -> Optional[Principal]:
+        digest = self._digest(token)
+        principal = self._local.get((user_id, digest))
+        if principal is not None:
+            metrics.incr("principal_cache.hits_local")
+            return principal
+        try:
+            raw = await get_redis().hget(self._redis_key(user_id), digest)
+            if raw:
+                principal = Principal.from_json(raw)
+                self._local.set((user_id, digest), principal)
+                metrics.incr("principal_cache.hits_redis")
+                return principal
+        except Exception as e:
+            logger.warning("principal_cache_redis_failed", error=str(e))
+        metrics.incr("principal_cache.misses")
+        return None
+
+    async def set(self, token: str, principal: Principal) -> None:
+        digest = self._digest(token)
+        self._local.set((principal.id, digest), principal)
+        try:
+            key = self._redis_key(principal.id)
+            async with get_redis().pipeline(transaction=True) as pipe:
+                pipe.hset(key, digest, principal.to_json())
+                pipe.expire(key, settings.PRINCIPAL_CACHE_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("principal_cache_redis_failed", error=str(e))
+
+    def invalidate_local(self, user_id: int) -> None:
+        self._local.delete_where(lambda key: key[0] == user_id)
+
+    async def invalidate(self, user_id: int) -> None:
+        self.invalidate_local(user_id)
+        try:
+            await get_redis().delete(self._redis_key(user_id))
+        except Exception as e:
+            logger.warning("principal_cache_invalidate_failed", user_id=user_id, error=str(e))
+        metrics.incr("principal_cache.invalidations")
+
+
+principal_cache = PrincipalCache()
+_pending_invalidations: set = set()
+
+
+# --- Invalidation on user changes ---
+# ORM updates/deletes of a User mark it on the session; once the change is committed the
+# cached principals are dropped (locally right away, in Redis on the running loop).
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _mark_user_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    user_ids = session.info.pop("changed_user_ids", None)
+    if not user_ids:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    for user_id in user_ids:
+        principal_cache.invalidate_local(user_id)
+        if loop is not None:
+            task = loop.create_task(principal_cache.invalidate(user_id))
+            _pending_invalidations.add(task)
+            task.add_done_callback(_pending_invalidations.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("changed_user_ids", None)
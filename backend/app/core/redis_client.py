@@ -0,0 +1,31 @@
+import asyncio
+import weakref
+
+import redis.asyncio as redis
+
+from app.core.config import settings
+
+# redis.asyncio connections belong to the loop that opened them, and Celery tasks may
+# run on different loops, so keep one client per running loop.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, redis.Redis]" = weakref.WeakKeyDictionary()
+
+
+def redis_url(db: int = 0) -> str:
+    return f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/{db}"
+
+
+def get_redis() -> redis.Redis:
+    """
+    Shared async Redis client (cache DB) for the current event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = redis.from_url(
+            redis_url(settings.REDIS_CACHE_DB),
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+        _clients[loop] = client
+    return client
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+
+# Event types of the chat stream:
+#   sources - list of source names, sent before the answer
+#   token   - {"text": ...}, answer text (several LLM tokens per frame)
+#   timing  - {"first_token_ms": ..., "total_ms": ...}
+#   done    - end of the answer, with any data the endpoint attaches
+#   error   - {"message": ...}, the answer could not be completed
+HEARTBEAT = b": ping\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no", # nginx: pass frames through instead of buffering them
+}
+
+
+def format_event(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    """
+    One SSE frame. Data is JSON on a single line, so it never needs splitting
+    into several `data:` fields.
+    """
+    frame = f"event: {event}\n"
+    if event_id is not None:
+        frame += f"id: {event_id}\n"
+    frame += f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+    return frame.encode("utf-8")
+
+
+class EventStream:
+    """
+    Serializes (event, data) pairs from a producer as Server-Sent Events.
+
+    Token text is coalesced: buffered tokens are sent as one `token` frame once
+    SSE_FLUSH_BYTES have accumulated or SSE_FLUSH_INTERVAL_MS after the first of them,
+    instead of one write per LLM token. Any other event flushes the buffer first, so
+    order is preserved. While the producer is quiet (e.g. during retrieval), a comment
+    line is sent every SSE_HEARTBEAT_INTERVAL seconds so proxies keep the connection
+    open. A completed stream ends with `timing` and then `done` or `error`.
+
+    `disconnected` completes when the client goes away. The producer is then
+    cancelled right away (even while the response is blocked writing), so the work
+    behind it stops instead of running to completion for nobody.
+    """
+
+    def __init__(
+        self,
+        events: AsyncIterator[Tuple[str, Any]],
+        done: Optional[Dict[str, Any]] = None,
+        disconnected: Optional[Awaitable[None]] = None,
+        flush_interval_ms: float = settings.SSE_FLUSH_INTERVAL_MS,
+        flush_bytes: int = settings.SSE_FLUSH_BYTES,
+        heartbeat_interval: float = settings.SSE_HEARTBEAT_INTERVAL,
+    ):
+        self.events = events
+        self.done = done or {}
+        self.disconnected = disconnected
+        self.abandoned = False
+        self._source: Optional[AsyncIterator[Tuple[str, Any]]] = None
+        self._pending: Optional[asyncio.Future] = None
+        self._closing: Optional[asyncio.Future] = None
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_bytes = flush_bytes
+        self.heartbeat_interval = heartbeat_interval
+        self._next_id = 0
+        self._tokens: List[str] = []
+        self._buffered = 0
+        self._flush_at: Optional[float] = None
+
+    def _event(self, event: str, data: Any) -> bytes:
+        self._next_id += 1
+        return format_event(event, data, self._next_id)
+
+    def _abandon(self, watch: asyncio.Future) -> None:
+        if watch.cancelled():
+            return
+        self.abandoned = True
+        metrics.incr("sse.disconnects")
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+        elif self._source is not None:
+            # Suspended between frames (e.g. the server stopped reading after a failed
+            # write): close the producer now rather than whenever it is collected
+            self._closing = asyncio.ensure_future(self._close_source())
+
+    async def _close_source(self) -> None:
+        aclose = getattr(self._source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    def _flush(self) -> Optional[bytes]:
+        if not self._tokens:
+            return None
+        frame = self._event("token", {"text": "".join(self._tokens)})
+        metrics.incr("sse.token_frames")
+        self._tokens = []
+        self._buffered = 0
+        self._flush_at = None
+        return frame
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        started = time.perf_counter()
+        first_token_ms = None
+        source = self._source = self.events.__aiter__()
+        watch = None
+        if self.disconnected is not None:
+            watch = asyncio.ensure_future(self.disconnected)
+            watch.add_done_callback(self._abandon)
+        last_write = time.monotonic()
+        try:
+            while True:
+                if self.abandoned:
+                    return
+                if self._pending is None:
+                    self._pending = asyncio.ensure_future(source.__anext__())
+                now = time.monotonic()
+                deadline = last_write + self.heartbeat_interval
+                if self._flush_at is not None:
+                    deadline = min(deadline, self._flush_at)
+                done, _ = await asyncio.wait({self._pending}, timeout=max(deadline - now, 0))
+
+                if self.abandoned:
+                    return
+                if not done:
+                    frame = self._flush() if self._flush_at is not None and time.monotonic() >= self._flush_at else None
+                    if frame is None and time.monotonic() - last_write >= self.heartbeat_interval:
+                        frame = HEARTBEAT
+                    if frame is not None:
+                        last_write = time.monotonic()
+                        yield frame
+                    continue
+
+                task, self._pending = self._pending, None
+                try:
+                    event, data = task.result()
+                except StopAsyncIteration:
+                    break
+
+                if event == "token":
+                    if not data:
+                        continue
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                    self._tokens.append(data)
+                    self._buffered += len(data.encode("utf-8"))
+                    metrics.incr("sse.tokens")
+                    if self._flush_at is None:
+                        self._flush_at = time.monotonic() + self.flush_interval
+                    if self._buffered < self.flush_bytes:
+                        continue
+                    frame = self._flush()
+                else:
+                    frame = (self._flush() or b"") + self._event(event, data)
+                last_write = time.monotonic()
+                yield frame
+        except Exception as e:
+            logger.exception("sse_stream_failed", error=str(e))
+            metrics.incr("sse.errors")
+            yield (self._flush() or b"") + self._event("error", {"message": "The answer could not be completed."})
+            return
+        finally:
+            if watch is not None:
+                watch.cancel()
+            if self._pending is not None:
+                self._pending.cancel()
+                await asyncio.gather(self._pending, return_exceptions=True)
+                self._pending = None
+            if self._closing is None:
+                self._closing = asyncio.ensure_future(self._close_source())
+            await self._closing
+
+        timing = {"first_token_ms": first_token_ms, "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+        yield (self._flush() or b"") + self._event("timing", timing) + self._event("done", self.done)
@@ -0,0 +1,27 @@
+import tiktoken
+
+from app.core.logging import logger
+
+
+class TokenCounter:
+    """
+    tiktoken-based token counts for a model, with the encoding loaded on first use.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+
+    def count(self, text: str) -> int:
+        if self._encoding is None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # BPE files unavailable (offline); fall back to a ~4 chars/token estimate
+                logger.warning("tiktoken_unavailable", error=str(e))
+                self._encoding = False
+        if self._encoding is False:
+            return len(text) // 4 + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from app.db.base import Base
 
@@ -12,6 +12,23 @@ class User(Base):
     is_superuser = Column(Boolean(), default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class Blob(Base):
+    """
+    One stored file content, shared by every Document uploaded with the same bytes.
+    Its chunks are indexed once, under `index_doc_id`, and removed with the last reference.
+    """
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False)
+    size_bytes = Column(BigInteger, nullable=True)
+    ref_count = Column(Integer, nullable=False, default=0)
+    # Status: pending, processing, indexed, failed
+    status = Column(String, nullable=False, default="pending")
+    # Chunk key in Chroma / the lexical index (`source_doc_id`): the first uploader's document id
+    index_doc_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class Document(Base):
     __tablename__ = "documents"
 
@@ -20,6 +37,8 @@ class Document(Base):
     filename = Column(String, nullable=False)
     s3_key = Column(String, nullable=False)
     media_type = Column(String, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True) # content hash (see Blob)
     
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -28,21 +47,38 @@ class Document(Base):
     # Status: pending, processing, indexed, failed
     status = Column(String, default="pending")
     error_message = Column(Text, nullable=True)
+
+    # Ingestion progress (written by the worker while processing)
+    pages_total = Column(Integer, nullable=True)
+    pages_processed = Column(Integer, nullable=True) # pages whose chunks are all indexed
+    chunks_indexed = Column(Integer, nullable=True)
+    processing_started_at = Column(DateTime(timezone=True), nullable=True)
+    progress_updated_at = Column(DateTime(timezone=True), nullable=True)
     
     owner_id = Column(Integer, ForeignKey("users.id"))
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # Keyset pagination of a user's sessions, newest activity first
+        Index("ix_chat_sessions_user_id_updated_at_id", "user_id", "updated_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     limit = Column(Integer, default=50) # Just in case we want to limit history per session
+    title = Column(String, nullable=True) # first user message, truncated; set when it is saved
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Bumped whenever a message is added (last activity)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
     
     user_id = Column(Integer, ForeignKey("users.id"))
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Most recent messages of a session (history window)
+        Index("ix_chat_messages_session_id_created_at", "session_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     role = Column(String, nullable=False) # user, assistant
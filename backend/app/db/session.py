@@ -1,15 +1,59 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
 from sqlalchemy.pool import NullPool
 
-engine = create_async_engine(settings.SQLALCHEMY_DATABASE_URI, future=True, echo=False, poolclass=NullPool)
+
+def build_engine(pool_size: int, max_overflow: int) -> AsyncEngine:
+    """
+    Async engine with a bounded connection pool; `pool_size <= 0` disables pooling.
+    """
+    if pool_size <= 0:
+        return create_async_engine(settings.SQLALCHEMY_DATABASE_URI, future=True, echo=False, poolclass=NullPool)
+    return create_async_engine(
+        settings.SQLALCHEMY_DATABASE_URI,
+        future=True,
+        echo=False,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+
+engine = build_engine(settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
 
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+
+def configure_worker_engine():
+    """
+    Swap in the worker pool profile after fork. Connections inherited from the parent
+    are dropped without being closed, so the parent's sockets are left untouched.
+    """
+    global engine
+    engine.sync_engine.dispose(close=False)
+    engine = build_engine(settings.WORKER_DB_POOL_SIZE, settings.WORKER_DB_MAX_OVERFLOW)
+    AsyncSessionLocal.configure(bind=engine)
+
+
+def pool_status() -> dict:
+    pool = engine.pool
+    if isinstance(pool, NullPool):
+        return {"pooled": False}
+    return {
+        "pooled": True,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
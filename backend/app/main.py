@@ -1,17 +1,45 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from asgi_correlation_id import CorrelationIdMiddleware
 from app.api.v1.api import api_router
 from app.core.config import settings
-from app.core.logging import configure_logging
+from app.core.logging import configure_logging, logger
+from app.core.executors import LoopWatchdog, shutdown_executors
+from app.rag.resources import resources, run_health_checks
+from app.rag.reranker import rerank_service
+from app.services.message_buffer import message_buffer
 
 # Configure Logging
 configure_logging()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build shared RAG clients once per process (Chroma, embeddings, FlashRank, web search)
+    status = await asyncio.to_thread(resources.warm_up)
+    logger.info("resources_warmed_up", resources=status)
+    health_task = asyncio.create_task(
+        run_health_checks(resources, settings.RESOURCE_HEALTH_CHECK_INTERVAL)
+    )
+    message_buffer.start()
+    loop_watchdog = LoopWatchdog(settings.LOOP_BLOCK_THRESHOLD_MS)
+    loop_watchdog.start()
+    try:
+        yield
+    finally:
+        await loop_watchdog.stop()
+        health_task.cancel()
+        await rerank_service.close()
+        # Persist every queued chat message before the process exits
+        await message_buffer.close()
+        shutdown_executors()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Set all CORS enabled origins
@@ -22,6 +50,7 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],
     )
 
 # Add Correlation ID Middleware
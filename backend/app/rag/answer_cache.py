@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Awaitable, Callable, List, Optional, Set
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.core.redis_client import get_redis
+from app.core.ttl_cache import TTLCache
+from app.rag.query_vectors import add_with_vector, search_by_vector_with_relevance
+from app.rag.resources import resources
+
+CORPUS_VERSION_KEY = "rag:corpus_version"
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+
+class CachedAnswer:
+    def __init__(self, answer: str, sources: List[str], tier: str):
+        self.answer = answer
+        self.sources = sources
+        self.tier = tier
+
+    def to_json(self) -> str:
+        return json.dumps({"answer": self.answer, "sources": self.sources})
+
+
+class AnswerCache:
+    """
+    Answer cache with three tiers, all scoped by (owner, corpus version):
+
+    1. in-process exact-match LRU (no network while the corpus version is fresh),
+    2. Redis exact-match entries shared by every API worker,
+    3. the Chroma `semantic_cache` collection for paraphrased questions.
+
+    Entries expire after ANSWER_CACHE_TTL and keep their original sources. The corpus
+    version is bumped whenever documents are added or removed; since retrieval runs
+    over the shared collection, the version is global and a bump retires every entry.
+    Each process re-reads it at most every ANSWER_CACHE_VERSION_TTL seconds, so a bump
+    made elsewhere (e.g. by the worker) takes up to that long to be seen.
+
+    Entries are keyed by the normalized standalone question: callers look up and store
+    the same (condensed) question.
+    """
+
+    def __init__(self):
+        self.ttl = settings.ANSWER_CACHE_TTL
+        self._local = TTLCache(settings.ANSWER_CACHE_L1_SIZE, settings.ANSWER_CACHE_L1_TTL)
+        self._fallback_version = 0
+        self._version: Optional[int] = None
+        self._version_read_at = 0.0
+        self._stores_since_prune = 0
+        self._background: Set[asyncio.Task] = set()
+
+    # --- Corpus version ---
+
+    async def corpus_version(self) -> int:
+        if self._version is not None and time.monotonic() - self._version_read_at < settings.ANSWER_CACHE_VERSION_TTL:
+            return self._version
+        try:
+            version = int(await get_redis().get(CORPUS_VERSION_KEY) or 0)
+        except Exception as e:
+            logger.warning("corpus_version_unavailable", error=str(e))
+            return self._fallback_version
+        self._remember_version(version)
+        return version
+
+    def _remember_version(self, version: int) -> None:
+        self._version = version
+        self._version_read_at = time.monotonic()
+
+    async def invalidate(self) -> int:
+        """
+        Retire every cached answer (call when the indexed corpus changes).
+        """
+        self._local.clear()
+        self._fallback_version += 1
+        try:
+            version = await get_redis().incr(CORPUS_VERSION_KEY)
+            self._remember_version(version)
+        except Exception as e:
+            logger.warning("corpus_version_bump_failed", error=str(e))
+            version = self._fallback_version
+            self._version = None
+        metrics.incr("answer_cache.invalidations")
+        return version
+
+    # --- Lookup / store ---
+
+    @staticmethod
+    def _key(owner_id: int, version: int, question: str) -> str:
+        digest = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        return f"answer:{owner_id}:{version}:{digest}"
+
+    def _record(self, tier: str) -> None:
+        metrics.incr(f"answer_cache.{tier}")
+
+    async def lookup(
+        self,
+        owner_id: int,
+        question: str,
+        vector: Callable[[], Awaitable[List[float]]],
+    ) -> Optional[CachedAnswer]:
+        """
+        Look the question up tier by tier. `vector` is only awaited for the semantic
+        tier, so exact hits cost no embedding call.
+        """
+        version = await self.corpus_version()
+        key = self._key(owner_id, version, question)
+
+        hit = self._local.get(key)
+        if hit is not None:
+            self._record("hits_local")
+            return CachedAnswer(hit.answer, hit.sources, "local")
+
+        try:
+            raw = await get_redis().get(key)
+            if raw:
+                data = json.loads(raw)
+                hit = CachedAnswer(data["answer"], data["sources"], "redis")
+                self._local.set(key, hit)
+                self._record("hits_redis")
+                return hit
+        except Exception as e:
+            logger.warning("answer_cache_redis_failed", error=str(e))
+
+        cache_store = resources.get("cache_store")
+        results = await search_by_vector_with_relevance(
+            cache_store,
+            await vector(),
+            k=1,
+            filter={"$and": [
+                {"owner_id": owner_id},
+                {"corpus_version": version},
+                {"expires_at": {"$gt": time.time()}},
+            ]},
+        )
+        if results:
+            doc, score = results[0]
+            if score > settings.ANSWER_CACHE_THRESHOLD:
+                hit = CachedAnswer(
+                    doc.metadata.get("answer", ""), json.loads(doc.metadata.get("sources", "[]")), "semantic"
+                )
+                self._local.set(key, hit)
+                self._record("hits_semantic")
+                return hit
+
+        self._record("misses")
+        return None
+
+    async def store(
+        self, owner_id: int, question: str, vector: List[float], answer: str, sources: List[str]
+    ) -> None:
+        version = await self.corpus_version()
+        key = self._key(owner_id, version, question)
+        entry = CachedAnswer(answer, sources, "local")
+        self._local.set(key, entry)
+
+        try:
+            await get_redis().set(key, entry.to_json(), ex=self.ttl)
+        except Exception as e:
+            logger.warning("answer_cache_redis_failed", error=str(e))
+
+        now = time.time()
+        await add_with_vector(
+            resources.get("cache_store"),
+            id=key,
+            text=question,
+            vector=vector,
+            metadata={
+                "answer": answer,
+                "sources": json.dumps(sources),
+                "owner_id": owner_id,
+                "corpus_version": version,
+                "created_at": now,
+                "expires_at": now + self.ttl,
+            },
+        )
+
+        self._stores_since_prune += 1
+        if self._stores_since_prune >= settings.ANSWER_CACHE_PRUNE_EVERY:
+            self._stores_since_prune = 0
+            task = asyncio.create_task(asyncio.to_thread(self._prune_semantic, version))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def _prune_semantic(self, version: int) -> None:
+        """
+        Drop expired and old-version entries, then evict the oldest beyond the size cap.
+        """
+        try:
+            collection = resources.get("cache_store")._collection
+            collection.delete(where={"$or": [
+                {"expires_at": {"$lt": time.time()}},
+                {"corpus_version": {"$lt": version}},
+            ]})
+            overflow = collection.count() - settings.ANSWER_CACHE_SEMANTIC_MAX_ENTRIES
+            if overflow > 0:
+                entries = collection.get(include=["metadatas"])
+                ranked = sorted(
+                    zip(entries["ids"], entries["metadatas"]),
+                    key=lambda e: (e[1] or {}).get("created_at", 0),
+                )
+                collection.delete(ids=[i for i, _ in ranked[:overflow]])
+                metrics.incr("answer_cache.evictions", overflow)
+        except Exception as e:
+            logger.warning("answer_cache_prune_failed", error=str(e))
+
+
+answer_cache = AnswerCache()
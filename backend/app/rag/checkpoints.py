@@ -0,0 +1,52 @@
+from typing import Dict, List
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.rag.pipeline import Checkpoint
+
+
+class CheckpointStore:
+    """
+    Ingestion checkpoints in Redis, one per (index document, page range):
+
+    - `ingest:ckpt:{doc}:{range}`      hash: `next_page` and `h:<chunk hash>` ordinal counts
+    - `ingest:ckpt:{doc}:{range}:ids`  set of committed chunk IDs
+
+    Updates are incremental (only what the commit frontier just passed), so saving
+    costs O(new chunks) rather than O(document).
+    """
+
+    @staticmethod
+    def _key(doc_id: int, range_start: int) -> str:
+        return f"ingest:ckpt:{doc_id}:{range_start}"
+
+    async def load(self, doc_id: int, range_start: int = 0) -> Checkpoint:
+        redis = get_redis()
+        key = self._key(doc_id, range_start)
+        state = await redis.hgetall(key)
+        if not state:
+            return Checkpoint()
+        ids = await redis.smembers(f"{key}:ids")
+        ordinals = {field[2:]: int(count) for field, count in state.items() if field.startswith("h:")}
+        return Checkpoint(int(state.get("next_page", 0)), ordinals, ids)
+
+    async def save(
+        self, doc_id: int, range_start: int, next_page: int, increments: Dict[str, int], committed_ids: List[str]
+    ) -> None:
+        key = self._key(doc_id, range_start)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            for chunk_hash, count in increments.items():
+                pipe.hincrby(key, f"h:{chunk_hash}", count)
+            pipe.hset(key, "next_page", next_page)
+            if committed_ids:
+                pipe.sadd(f"{key}:ids", *committed_ids)
+            pipe.expire(key, settings.INGEST_CHECKPOINT_TTL)
+            pipe.expire(f"{key}:ids", settings.INGEST_CHECKPOINT_TTL)
+            await pipe.execute()
+
+    async def clear(self, doc_id: int, range_start: int = 0) -> None:
+        key = self._key(doc_id, range_start)
+        await get_redis().delete(key, f"{key}:ids")
+
+
+checkpoints = CheckpointStore()
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingStore(ABC):
+    """Key/value store for packed embedding vectors."""
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        ...
+
+    @abstractmethod
+    def set_many(self, items: Dict[str, List[float]]) -> None:
+        ...
+
+
+class LocalEmbeddingStore(EmbeddingStore):
+    """
+    On-disk SQLite store with size-bounded LRU eviction.
+    WAL mode lets the API and worker processes share one file on the same volume.
+    Recency is tracked to `touch_interval` seconds: a hit only writes when its entry
+    was last touched longer ago than that, so most reads take no write lock.
+    """
+
+    def __init__(self, path: str, max_entries: int, touch_interval: float = settings.EMBEDDING_CACHE_TOUCH_INTERVAL):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_accessed ON embeddings (accessed)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        found: Dict[str, bytes] = {}
+        stale: List[str] = []
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), 500): # stay under SQLite's bound-parameter limit
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, accessed FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, vector, accessed in rows:
+                    found[key] = vector
+                    if now - accessed >= self.touch_interval:
+                        stale.append(key)
+            if stale:
+                self._conn.executemany(
+                    "UPDATE embeddings SET accessed = ? WHERE key = ?", [(now, k) for k in stale]
+                )
+                self._conn.commit()
+        return [_unpack(found[k]) if k in found else None for k in keys]
+
+    def set_many(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, accessed) VALUES (?, ?, ?)",
+                [(k, _pack(v), now) for k, v in items.items()],
+            )
+            self._count += len(items)
+            if self._count > self.max_entries:
+                # Evict least recently used entries down to 90% of capacity
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                overflow = self._count - int(self.max_entries * 0.9)
+                if overflow > 0:
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY accessed LIMIT ?)",
+                        (overflow,),
+                    )
+                    self._count -= overflow
+                    metrics.incr("embedding_cache.evictions", overflow)
+            self._conn.commit()
+
+
+class RedisEmbeddingStore(EmbeddingStore):
+    """
+    Redis-backed store. Entries carry a TTL that is refreshed on every hit;
+    size is bounded by the server's maxmemory / allkeys-lru policy.
+    """
+
+    def __init__(self, url: str, ttl: int):
+        import redis
+
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        values = self._client.mget(keys)
+        hits = [k for k, v in zip(keys, values) if v is not None]
+        if hits:
+            pipe = self._client.pipeline(transaction=False)
+            for k in hits:
+                pipe.expire(k, self.ttl)
+            pipe.execute()
+        return [_unpack(v) if v is not None else None for v in values]
+
+    def set_many(self, items: Dict[str, List[float]]) -> None:
+        pipe = self._client.pipeline(transaction=False)
+        for k, v in items.items():
+            pipe.set(k, _pack(v), ex=self.ttl)
+        pipe.execute()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from a persistent cache.
+
+    Keys are (model, dimensions, sha256(text)), so identical chunks across uploads and
+    repeated questions are embedded once. Cache failures degrade to direct embedding.
+    """
+
+    def __init__(self, inner: Embeddings, store: EmbeddingStore, model: str, dimensions: Optional[int] = None):
+        self.inner = inner
+        self.store = store
+        self.namespace = f"emb:{model}:{dimensions or 'default'}"
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        return f"{self.namespace}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _lookup(self, texts: List[str]) -> List[Optional[List[float]]]:
+        try:
+            return self.store.get_many([self._key(t) for t in texts])
+        except Exception as e:
+            logger.warning("embedding_cache_read_failed", error=str(e))
+            return [None] * len(texts)
+
+    def _save(self, texts: List[str], vectors: List[List[float]]) -> None:
+        try:
+            self.store.set_many({self._key(t): v for t, v in zip(texts, vectors)})
+        except Exception as e:
+            logger.warning("embedding_cache_write_failed", error=str(e))
+
+    def _record(self, hits: int, misses: int) -> None:
+        self.hits += hits
+        self.misses += misses
+        metrics.incr("embedding_cache.hits", hits)
+        metrics.incr("embedding_cache.misses", misses)
+
+    @staticmethod
+    def _missing(texts: List[str], cached: List[Optional[List[float]]]) -> List[str]:
+        # De-duplicate so a text repeated within one call is embedded once
+        return list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+
+    @staticmethod
+    def _merge(texts, cached, missing, computed) -> List[List[float]]:
+        fresh = dict(zip(missing, computed))
+        return [v if v is not None else fresh[t] for t, v in zip(texts, cached)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = self._lookup(texts)
+        missing = self._missing(texts, cached)
+        self._record(len(texts) - len(missing), len(missing))
+        computed = self.inner.embed_documents(missing) if missing else []
+        if missing:
+            self._save(missing, computed)
+        return self._merge(texts, cached, missing, computed)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = await asyncio.to_thread(self._lookup, texts)
+        missing = self._missing(texts, cached)
+        self._record(len(texts) - len(missing), len(missing))
+        computed = await self.inner.aembed_documents(missing) if missing else []
+        if missing:
+            await asyncio.to_thread(self._save, missing, computed)
+        return self._merge(texts, cached, missing, computed)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else None}
+
+
+def build_embedding_store() -> Optional[EmbeddingStore]:
+    backend = settings.EMBEDDING_CACHE_BACKEND
+    if backend == "redis":
+        return RedisEmbeddingStore(
+            f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/{settings.EMBEDDING_CACHE_REDIS_DB}",
+            settings.EMBEDDING_CACHE_TTL,
+        )
+    if backend == "local":
+        return LocalEmbeddingStore(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_ENTRIES)
+    return None
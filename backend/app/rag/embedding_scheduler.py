@@ -0,0 +1,183 @@
+import asyncio
+import random
+import time
+from typing import List, Optional
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.core.tokens import TokenCounter
+
+
+def _status_code(e: Exception) -> Optional[int]:
+    return getattr(e, "status_code", None)
+
+def _is_throttled(e: Exception) -> bool:
+    return _status_code(e) == 429
+
+def _is_retryable(e: Exception) -> bool:
+    status = _status_code(e)
+    return status == 429 or (status is not None and status >= 500) or isinstance(e, openai.APIConnectionError)
+
+def _retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class EmbeddingScheduler(Embeddings):
+    """
+    Rate-limit-aware front-end for the embedding API, shared per process.
+
+    Texts are packed into requests by token count (tiktoken), and requests run
+    concurrently inside an adaptive in-flight window: it grows additively while
+    calls succeed under the latency target, halves on a 429 and shrinks by a quarter
+    on a call slower than EMBED_TARGET_LATENCY (AIMD; a slow call is an early warning,
+    not a rejection). Retryable failures back off with full jitter, honouring Retry-After.
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        model: str,
+        max_concurrency: int = settings.EMBED_MAX_CONCURRENCY,
+        initial_concurrency: int = settings.EMBED_INITIAL_CONCURRENCY,
+        max_batch_tokens: int = settings.EMBED_MAX_BATCH_TOKENS,
+        max_batch_size: int = settings.EMBED_MAX_BATCH_SIZE,
+        max_retries: int = settings.EMBED_MAX_RETRIES,
+        target_latency: float = settings.EMBED_TARGET_LATENCY,
+    ):
+        self.inner = inner
+        self.max_concurrency = max_concurrency
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.target_latency = target_latency
+        self.window = float(min(initial_concurrency, max_concurrency))
+        self.in_flight = 0
+        self.model = model
+        self._tokens = TokenCounter(model)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cond: Optional[asyncio.Condition] = None
+
+    # --- Batching ---
+
+    def count_tokens(self, text: str) -> int:
+        return self._tokens.count(text)
+
+    def plan_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Group text indexes into requests bounded by token and input counts.
+        """
+        batches, current, tokens = [], [], 0
+        for i, text in enumerate(texts):
+            n = self.count_tokens(text)
+            if current and (tokens + n > self.max_batch_tokens or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(i)
+            tokens += n
+        if current:
+            batches.append(current)
+        return batches
+
+    # --- Adaptive window ---
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio primitives are loop-bound; start fresh on a new loop
+            self._loop = loop
+            self._cond = asyncio.Condition()
+            self.in_flight = 0
+        return self._cond
+
+    async def _acquire(self) -> None:
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < max(1, int(self.window)))
+            self.in_flight += 1
+
+    async def _release(self) -> None:
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    def _on_success(self, latency: float) -> None:
+        if latency > self.target_latency:
+            self.window = max(1.0, self.window * 0.75)
+        else:
+            self.window = min(float(self.max_concurrency), self.window + 1 / self.window)
+        metrics.set_gauge("embedding_scheduler.window", round(self.window, 2))
+
+    def _on_throttled(self) -> None:
+        self.window = max(1.0, self.window / 2)
+        metrics.incr("embedding_scheduler.throttled")
+        metrics.set_gauge("embedding_scheduler.window", round(self.window, 2))
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        retry_after = _retry_after(e)
+        delay = random.uniform(0, min(settings.EMBED_MAX_BACKOFF, settings.EMBED_BASE_BACKOFF * 2 ** attempt))
+        return max(delay, retry_after or 0)
+
+    # --- Execution ---
+
+    async def _run_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            await self._acquire()
+            started = time.monotonic()
+            error = None
+            try:
+                vectors = await self.inner.aembed_documents(texts)
+            except Exception as e:
+                error = e
+            finally:
+                # Cancellation included; shielded so the window slot is always returned
+                await asyncio.shield(self._release())
+            if error is None:
+                self._on_success(time.monotonic() - started)
+                return vectors
+            if _is_throttled(error):
+                self._on_throttled()
+            if attempt == self.max_retries or not _is_retryable(error):
+                raise error
+            delay = self._backoff(attempt, error)
+            metrics.incr("embedding_scheduler.retries")
+            logger.warning("embedding_retry", attempt=attempt + 1, delay=round(delay, 2), error=str(error))
+            await asyncio.sleep(delay)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = self.plan_batches(texts)
+        results = await asyncio.gather(*(self._run_batch([texts[i] for i in b]) for b in batches))
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, results):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Sync callers (e.g. Chroma's query path) get the same retry policy, without the window
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.inner.embed_documents(texts)
+            except Exception as e:
+                if _is_throttled(e):
+                    self._on_throttled()
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                metrics.incr("embedding_scheduler.retries")
+                time.sleep(self._backoff(attempt, e))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
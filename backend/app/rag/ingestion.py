@@ -1,75 +1,149 @@
-from typing import List
+import itertools
 import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+from langchain_core.documents import Document as LCDocument
+from pypdf import PdfReader
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader, UnstructuredMarkdownLoader
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from app.core.config import settings
-import chromadb
-
-# Initialize Embeddings (Safe to do globally as it's just an API client config)
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-small",
-    openai_api_key=settings.OPENAI_API_KEY
-)
+from app.core.logging import logger
+from app.rag.pipeline import Checkpoint, CheckpointCallback, IngestionPipeline, delete_chunks
+from app.rag.resources import resources
 
 def get_vector_store():
     """
-    Lazy load vector store to prevent import-time connection errors.
+    Shared vector store from the process-wide resource registry (built once, lazily).
     """
-    chroma_client = chromadb.HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)
-    return Chroma(
-        client=chroma_client,
-        collection_name="rag_collection",
-        embedding_function=embeddings,
-    )
+    return resources.get("vector_store")
 
-async def ingest_document(file_path: str, doc_id: int):
-    """
-    Load, Split, Embed, and Index a document.
-    """
-    # 1. Load Document
+def get_loader(file_path: str):
     if file_path.endswith(".pdf"):
-        loader = PyPDFLoader(file_path)
+        return PyPDFLoader(file_path)
     elif file_path.endswith(".docx"):
-        loader = Docx2txtLoader(file_path)
+        return Docx2txtLoader(file_path)
     elif file_path.endswith(".md"):
-        loader = UnstructuredMarkdownLoader(file_path)
-    else:
-        # Default to TextLoader
-        loader = TextLoader(file_path)
+        return UnstructuredMarkdownLoader(file_path)
+    # Default to TextLoader
+    return TextLoader(file_path)
+
+def count_pages(file_path: str) -> int:
+    """
+    Page count for PDFs (read from the page tree, no text extraction); other formats
+    are ingested as a single unit and count as one page.
+    """
+    if not file_path.endswith(".pdf"):
+        return 1
+    return len(PdfReader(file_path).pages)
+
+def page_ranges(n_pages: int, size: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + size, n_pages)) for start in range(0, n_pages, size)]
+
+def load_pdf_pages(file_path: str, start: int, end: int) -> Iterator[LCDocument]:
+    """
+    Lazily extract pages [start, end) of a PDF, without touching the pages before them.
+    """
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+    for i in range(start, min(end, total)):
+        yield LCDocument(
+            page_content=reader.pages[i].extract_text() or "",
+            metadata={"source": file_path, "page": i, "total_pages": total},
+        )
 
-    docs = loader.load()
+def _pipeline(doc_id: int, pages, source: str, **kwargs) -> IngestionPipeline:
+    def add_metadata(page):
+        page.metadata["source_doc_id"] = doc_id
+        page.metadata["source"] = source
 
-    # 2. Add Metadata
-    for doc in docs:
-        doc.metadata["source_doc_id"] = doc_id
-        doc.metadata["source"] = os.path.basename(file_path)
+    return IngestionPipeline(
+        doc_id=doc_id,
+        pages=pages,
+        splitter=RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100),
+        vector_store=get_vector_store(),
+        prepare=add_metadata,
+        lexical_index=resources.get("lexical_index"),
+        **kwargs,
+    )
 
-    # 3. Split Text
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = text_splitter.split_documents(docs)
+async def ingest_document(
+    file_path: str,
+    doc_id: int,
+    source: Optional[str] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    on_checkpoint: Optional[CheckpointCallback] = None,
+):
+    """
+    Load, Split, Embed, and Index a document.
+    Pages are streamed through a bounded pipeline (see app/rag/pipeline.py), and
+    re-ingesting an already indexed document only embeds the chunks that changed
+    (IDs are per index document: a replaced document keeps its own, see
+    `replace_document`, while an edited file uploaded anew is embedded in full).
+    `source` is the name shown to users (stored files are named by content hash).
+    With a `checkpoint`, pages before `checkpoint.next_page` are skipped: a PDF resumes
+    at that page without extracting the ones before it (other formats are one page).
+    """
+    skip = checkpoint.next_page if checkpoint else 0
+    if skip and file_path.endswith(".pdf"):
+        pages = lambda: load_pdf_pages(file_path, skip, count_pages(file_path))
+    else:
+        loader = get_loader(file_path)
+        pages = lambda: itertools.islice(loader.lazy_load(), skip, None)
+    pipeline = _pipeline(
+        doc_id,
+        pages,
+        source or os.path.basename(file_path),
+        checkpoint=checkpoint,
+        on_checkpoint=on_checkpoint,
+    )
+    return await pipeline.run()
 
-    # 4. Filter empty chunks
-    chunks = [c for c in chunks if c.page_content.strip()]
-    
-    if not chunks:
-        return # Nothing to index
+async def ingest_page_range(
+    file_path: str,
+    doc_id: int,
+    start: int,
+    end: int,
+    source: Optional[str] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    on_checkpoint: Optional[CheckpointCallback] = None,
+) -> List[str]:
+    """
+    Index pages [start, end) of a large PDF as one part of a fanned-out ingestion.
+    Returns the chunk IDs it produced; stale chunks are removed by `finalize_document`
+    once every range is done. Checkpoint pages are relative to `start`.
+    """
+    skip = checkpoint.next_page if checkpoint else 0
+    pipeline = _pipeline(
+        doc_id,
+        lambda: load_pdf_pages(file_path, start + skip, end),
+        source or os.path.basename(file_path),
+        range_start=start,
+        delete_stale=False,
+        checkpoint=checkpoint,
+        on_checkpoint=on_checkpoint,
+    )
+    await pipeline.run()
+    return pipeline.seen_ids
 
-    # 5. Index to ChromaDB
-    vector_store = get_vector_store()
-    vector_store.add_documents(documents=chunks)
+def finalize_document(doc_id: int, chunk_ids: Iterable[str]) -> int:
+    """
+    Delete the chunks of `doc_id` not produced by the latest (fanned-out) ingestion.
+    """
+    keep = set(chunk_ids)
+    existing = get_vector_store().get(where={"source_doc_id": doc_id}, include=[])
+    stale = [chunk_id for chunk_id in existing["ids"] if chunk_id not in keep]
+    delete_chunks(get_vector_store(), resources.get("lexical_index"), stale)
+    return len(stale)
 
 def delete_document_from_vector_store(doc_id: int):
     """
     Delete all chunks associated with a document ID.
-    Since we didn't use custom IDs during ingestion (letting Chroma generate them),
-    we must delete by metadata filter.
+    Deleting by metadata filter also covers chunks indexed before deterministic IDs.
     """
     try:
         # Delete by metadata "source_doc_id"
         vector_store = get_vector_store()
         vector_store.delete(where={"source_doc_id": doc_id})
+        lexical_index = resources.get("lexical_index")
+        if lexical_index is not None:
+            lexical_index.delete_document(doc_id)
     except Exception as e:
-        from app.core.logging import logger
         logger.error("chroma_delete_failed", doc_id=doc_id, error=str(e))
@@ -0,0 +1,245 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+
+# Keeps part numbers and error codes (e.g. "XK-200.3", "0x80070005", "E_FAIL") intact
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in into is it its of on or "
+    "that the their there these this to was were what when where which who why will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    Local BM25 inverted index kept alongside the Chroma collection.
+
+    Stored in SQLite (WAL) on the shared volume so the API and workers see the same
+    index; chunk additions and deletions are applied incrementally by ingestion.
+    The chunk count and total length BM25 needs are kept in a one-row `stats` table,
+    maintained by triggers on every write, so a search never aggregates the corpus.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                doc_id INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_chunks_doc_id ON chunks (doc_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_postings_chunk_id ON postings (chunk_id);
+            """
+        )
+        self._conn.executescript(
+            """
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                n_chunks INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats SELECT 0, COUNT(*), TOTAL(length) FROM chunks;
+            CREATE TRIGGER IF NOT EXISTS chunks_stats_insert AFTER INSERT ON chunks BEGIN
+                UPDATE stats SET n_chunks = n_chunks + 1, total_length = total_length + NEW.length WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_stats_delete AFTER DELETE ON chunks BEGIN
+                UPDATE stats SET n_chunks = n_chunks - 1, total_length = total_length - OLD.length WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_stats_update AFTER UPDATE OF length ON chunks BEGIN
+                UPDATE stats SET total_length = total_length - OLD.length + NEW.length WHERE id = 0;
+            END;
+            COMMIT;
+            """
+        )
+
+    # --- Writes ---
+
+    def _delete_ids(self, ids: List[str]) -> None:
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+
+    def upsert(self, chunks: Iterable[Tuple[str, int, str, dict]]) -> None:
+        """
+        Add or replace chunks given as (chunk_id, doc_id, text, metadata).
+        """
+        chunks = list(chunks)
+        if not chunks:
+            return
+        rows, postings = [], []
+        for chunk_id, doc_id, text, metadata in chunks:
+            terms = Counter(tokenize(text))
+            rows.append((chunk_id, doc_id, sum(terms.values()), text, json.dumps(metadata, default=str)))
+            postings.extend((term, chunk_id, tf) for term, tf in terms.items())
+        with self._lock:
+            self._delete_ids([c[0] for c in chunks])
+            self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+            self._conn.commit()
+
+    def update_metadata(self, items: Iterable[Tuple[str, dict]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ? WHERE chunk_id = ?",
+                [(json.dumps(m, default=str), chunk_id) for chunk_id, m in items],
+            )
+            self._conn.commit()
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            self._delete_ids(list(ids))
+            self._conn.commit()
+
+    def delete_document(self, doc_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM postings WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE doc_id = ?)", (doc_id,)
+            )
+            self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            self._conn.commit()
+
+    def missing(self, ids: List[str]) -> List[str]:
+        """
+        IDs not present in the index (e.g. chunks indexed in Chroma before this index existed).
+        """
+        present = set()
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                present.update(
+                    r[0] for r in self._conn.execute(
+                        f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({placeholders})", batch
+                    )
+                )
+        return [i for i in ids if i not in present]
+
+    # --- Search ---
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[Document, float]]:
+        """
+        Top-k chunks by BM25 score.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_chunks, total_length = self._conn.execute("SELECT n_chunks, total_length FROM stats").fetchone()
+            if not n_chunks:
+                return []
+            avgdl = total_length / n_chunks
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                df = self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if not df:
+                    continue
+                if n_chunks >= 100 and df > n_chunks * settings.LEXICAL_MAX_DF_RATIO:
+                    continue # near-stopword for this corpus: contributes ~nothing, costs a full scan
+                idf = math.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+                rows = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term = ?",
+                    (term,),
+                )
+                for chunk_id, tf, length in rows:
+                    norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avgdl))
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * norm
+
+            top = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+            if not top:
+                return []
+            placeholders = ",".join("?" * len(top))
+            rows = {
+                r[0]: r[1:] for r in self._conn.execute(
+                    f"SELECT chunk_id, text, metadata FROM chunks WHERE chunk_id IN ({placeholders})",
+                    [chunk_id for chunk_id, _ in top],
+                )
+            }
+        return [
+            (Document(id=chunk_id, page_content=rows[chunk_id][0], metadata=json.loads(rows[chunk_id][1])), score)
+            for chunk_id, score in top
+            if chunk_id in rows
+        ]
+
+
+def chunk_key(doc: Document) -> str:
+    """
+    Stable identity of a retrieved chunk across the vector and lexical retrievers.
+    """
+    return doc.metadata.get("chunk_id") or doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = 60) -> List[Tuple[Document, float]]:
+    """
+    Fuse ranked lists: score(d) = sum over lists of 1 / (k + rank).
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = chunk_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1 / (k + rank)
+    return [(docs[key], score) for key, score in sorted(scores.items(), key=lambda x: x[1], reverse=True)]
+
+
+class HybridResult:
+    def __init__(self, docs: List[Document], agreed: bool, vector_relevance: Optional[float] = None):
+        self.docs = docs
+        self.agreed = agreed
+        self.vector_relevance = vector_relevance # best vector hit's relevance, if known
+
+
+def fuse(
+    vector_docs: List[Document],
+    lexical_hits: List[Tuple[Document, float]],
+    limit: int,
+    vector_relevance: Optional[float] = None,
+) -> HybridResult:
+    """
+    RRF-fuse vector and BM25 hits and report whether both retrievers agree on the
+    top results (in which case reranking adds little and can be skipped).
+    """
+    lexical_docs = [doc for doc, _ in lexical_hits]
+    fused = [doc for doc, _ in reciprocal_rank_fusion([vector_docs, lexical_docs], k=settings.HYBRID_RRF_K)]
+
+    depth = settings.HYBRID_AGREEMENT_DEPTH
+    agreed = (
+        len(vector_docs) >= depth
+        and len(lexical_docs) >= depth
+        and {chunk_key(d) for d in vector_docs[:depth]} == {chunk_key(d) for d in lexical_docs[:depth]}
+    )
+    return HybridResult(fused[:limit], agreed, vector_relevance)
@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import json
+import queue
+import threading
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+
+from app.core.config import settings
+from app.core.logging import logger
+
+_END = object()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def make_chunk_id(doc_id: int, chunk_hash: str, ordinal: int, range_start: int = 0) -> str:
+    """
+    Deterministic chunk ID from (doc_id, content hash, position).
+    The position is the occurrence number of identical content within the document,
+    so editing one section does not shift the IDs of every chunk after it. Documents
+    ingested in page ranges count occurrences per range, so the range's first page is
+    part of the key (left out for the first range, matching whole-document IDs).
+
+    IDs are scoped to `doc_id`, which is the blob's `index_doc_id`: the diff applies when
+    the same stored content is ingested again (retries, re-processing after a splitter
+    or metadata change) and when a document is replaced by an edited file, which keeps
+    its index document unless other documents share the old content.
+    """
+    key = f"{doc_id}:{chunk_hash}:{ordinal}" if not range_start else f"{doc_id}:{range_start}:{chunk_hash}:{ordinal}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def metadata_fingerprint(metadata: dict) -> str:
+    return hashlib.sha1(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def delete_chunks(vector_store, lexical_index, ids: List[str]) -> None:
+    if not ids:
+        return
+    vector_store.delete(ids=ids)
+    if lexical_index is not None:
+        lexical_index.delete(ids)
+
+
+class Checkpoint:
+    """
+    Resume point of an interrupted ingestion: every chunk of the pages before
+    `next_page` is committed (`committed_ids`), and `ordinals` counts the chunk
+    hashes seen in those pages so the chunks after them get the same IDs as before.
+    """
+
+    def __init__(self, next_page: int = 0, ordinals: Optional[Dict[str, int]] = None, committed_ids: Iterable[str] = ()):
+        self.next_page = next_page
+        self.ordinals = ordinals or {}
+        self.committed_ids = set(committed_ids)
+
+
+# on_checkpoint(next_page, ordinal increments, newly committed chunk IDs)
+CheckpointCallback = Callable[[int, Dict[str, int], List[str]], Awaitable[None]]
+
+
+class _Batch:
+    """
+    kind: "add" (new content, embedded), "update" (metadata moved only) or
+    "backfill" (unchanged in Chroma, only needs checking against the lexical index).
+    """
+    __slots__ = ("kind", "chunks", "vectors")
+
+    def __init__(self, kind: str, chunks: List[Document], vectors: Optional[List[List[float]]] = None):
+        self.kind = kind
+        self.chunks = chunks
+        self.vectors = vectors
+
+    @property
+    def ids(self) -> List[str]:
+        return [c.metadata["chunk_id"] for c in self.chunks]
+
+
+class IngestionPipeline:
+    """
+    Bounded-memory ingestion: lazy page loading -> incremental splitting ->
+    fixed-size embedding batches -> batched Chroma (and BM25 index) upserts.
+
+    Parsing runs in a thread and feeds a bounded chunk queue; embedding and upserting
+    run as separate coroutines joined by a bounded batch queue, so embedding batch N
+    overlaps parsing of batch N+1 and writing of batch N-1. Only chunk IDs (not chunk
+    text) are kept for the whole document, to diff against what is already indexed.
+
+    Batches commit out of page order, so the pipeline tracks the commit frontier: the
+    first page that still has uncommitted chunks. Whenever it advances, `on_checkpoint`
+    is awaited, and a run started from the resulting `Checkpoint` (with `pages`
+    yielding from `checkpoint.next_page` on) skips everything before it.
+    """
+
+    def __init__(
+        self,
+        doc_id: int,
+        pages: Callable[[], Iterable[Document]],
+        splitter: TextSplitter,
+        vector_store,
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+        max_queued_chunks: int = settings.INGEST_MAX_QUEUED_CHUNKS,
+        max_queued_batches: int = settings.INGEST_MAX_QUEUED_BATCHES,
+        prepare: Optional[Callable[[Document], None]] = None,
+        lexical_index=None,
+        range_start: int = 0,
+        delete_stale: bool = True,
+        checkpoint: Optional[Checkpoint] = None,
+        on_checkpoint: Optional[CheckpointCallback] = None,
+    ):
+        self.doc_id = doc_id
+        self.pages = pages
+        self.splitter = splitter
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.prepare = prepare
+        self.lexical_index = lexical_index
+        self.range_start = range_start
+        self.delete_stale = delete_stale
+        self._chunks: "queue.Queue" = queue.Queue(maxsize=max_queued_chunks)
+        self._batches: asyncio.Queue = asyncio.Queue(maxsize=max_queued_batches)
+        self._stop = threading.Event()
+        self._seen: set = set()
+        self._existing: Dict[str, str] = {}
+        self.stats = {"pages": 0, "added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+
+        # Commit frontier (shared between the parsing thread and the event loop)
+        self.checkpoint = checkpoint or Checkpoint()
+        self.on_checkpoint = on_checkpoint
+        self._seen.update(self.checkpoint.committed_ids)
+        self.frontier = self.checkpoint.next_page
+        self._produced_through = self.checkpoint.next_page
+        self._page_pending: Counter = Counter()
+        self._page_log: Dict[int, List[Tuple[str, str]]] = {}
+        self._chunk_page: Dict[str, int] = {}
+        self._progress_lock = threading.Lock()
+        self._commit_lock = asyncio.Lock() # checkpoints are saved in frontier order
+
+    # --- Stage 1: parse + split (worker thread) ---
+
+    def _iter_chunks(self) -> Iterator[Document]:
+        ordinals = Counter(self.checkpoint.ordinals)
+        for page_no, page in enumerate(self.pages(), start=self.checkpoint.next_page):
+            if self.prepare:
+                self.prepare(page)
+            self.stats["pages"] += 1
+            for chunk in self.splitter.split_documents([page]):
+                if not chunk.page_content.strip():
+                    continue
+                chunk_hash = content_hash(chunk.page_content)
+                chunk_id = make_chunk_id(self.doc_id, chunk_hash, ordinals[chunk_hash], self.range_start)
+                chunk.metadata["chunk_id"] = chunk_id
+                ordinals[chunk_hash] += 1
+                with self._progress_lock:
+                    self._chunk_page[chunk_id] = page_no
+                    self._page_pending[page_no] += 1
+                    self._page_log.setdefault(page_no, []).append((chunk_hash, chunk_id))
+                yield chunk
+            with self._progress_lock:
+                self._page_log.setdefault(page_no, [])
+                self._produced_through = page_no + 1
+
+    def _put(self, item) -> None:
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _produce(self) -> None:
+        try:
+            for chunk in self._iter_chunks():
+                if self._stop.is_set():
+                    return
+                self._put(chunk)
+        finally:
+            self._put(_END)
+
+    def _take_batch(self) -> Optional[List[Document]]:
+        batch = []
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            try:
+                item = self._chunks.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _END:
+                self._chunks.put(_END) # leave the marker for the next call
+                break
+            batch.append(item)
+        return batch or None
+
+    # --- Stage 2: embed ---
+
+    async def _embed_batch(self, chunks: List[Document], slots: asyncio.Semaphore) -> None:
+        # Acquired by the task itself: one cancelled before it ever ran holds no permit
+        async with slots:
+            vectors = await self.vector_store.embeddings.aembed_documents([c.page_content for c in chunks])
+            await self._batches.put(_Batch("add", chunks, vectors))
+
+    async def _embed(self) -> None:
+        # Several batches may be in flight; the shared embedding scheduler decides
+        # how many requests actually hit the API at once.
+        slots = asyncio.Semaphore(settings.INGEST_EMBED_CONCURRENCY)
+        pending: List[asyncio.Task] = []
+        try:
+            while True:
+                chunks = await asyncio.to_thread(self._take_batch)
+                if chunks is None:
+                    break
+                new, moved, unchanged = [], [], []
+                for chunk in chunks:
+                    chunk_id = chunk.metadata["chunk_id"]
+                    self._seen.add(chunk_id)
+                    fingerprint = self._existing.get(chunk_id)
+                    if fingerprint is None:
+                        new.append(chunk)
+                    elif fingerprint != metadata_fingerprint(chunk.metadata):
+                        moved.append(chunk)
+                    else:
+                        unchanged.append(chunk)
+                self.stats["unchanged"] += len(unchanged)
+                if unchanged and self.lexical_index is not None:
+                    await self._batches.put(_Batch("backfill", unchanged))
+                elif unchanged:
+                    await self._commit([c.metadata["chunk_id"] for c in unchanged])
+                if moved:
+                    await self._batches.put(_Batch("update", moved))
+                if new:
+                    if len(pending) >= settings.INGEST_EMBED_CONCURRENCY:
+                        await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in pending:
+                        if task.done():
+                            task.result() # surface embedding failures early
+                    pending = [t for t in pending if not t.done()]
+                    pending.append(asyncio.ensure_future(self._embed_batch(new, slots)))
+            await asyncio.gather(*pending)
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+        finally:
+            if not self._stop.is_set():
+                await self._batches.put(_END)
+
+    # --- Stage 3: upsert ---
+
+    def _write(self, batch: _Batch) -> None:
+        collection = self.vector_store._collection
+        lexical = self.lexical_index
+        ids = batch.ids
+        metadatas = [c.metadata for c in batch.chunks]
+        if batch.kind == "add":
+            collection.upsert(
+                ids=ids,
+                embeddings=batch.vectors,
+                documents=[c.page_content for c in batch.chunks],
+                metadatas=metadatas,
+            )
+            if lexical is not None:
+                lexical.upsert((i, self.doc_id, c.page_content, c.metadata) for i, c in zip(ids, batch.chunks))
+            self.stats["added"] += len(ids)
+        elif batch.kind == "update":
+            # Unchanged content, only metadata moved (e.g. page number): no re-embedding
+            collection.update(ids=ids, metadatas=metadatas)
+            if lexical is not None:
+                lexical.update_metadata(zip(ids, metadatas))
+            self.stats["updated"] += len(ids)
+        elif lexical is not None:
+            # Chunks indexed in Chroma before the lexical index existed
+            missing = set(lexical.missing(ids))
+            if missing:
+                lexical.upsert(
+                    (i, self.doc_id, c.page_content, c.metadata) for i, c in zip(ids, batch.chunks) if i in missing
+                )
+
+    async def _upsert(self) -> None:
+        while True:
+            batch = await self._batches.get()
+            if batch is _END:
+                break
+            await asyncio.to_thread(self._write, batch)
+            await self._commit(batch.ids)
+
+    # --- Checkpointing ---
+
+    def _advance(self, ids: List[str]) -> Optional[Tuple[int, Dict[str, int], List[str]]]:
+        with self._progress_lock:
+            for chunk_id in ids:
+                page_no = self._chunk_page.pop(chunk_id, None)
+                if page_no is not None:
+                    self._page_pending[page_no] -= 1
+            start = self.frontier
+            increments: Counter = Counter()
+            committed: List[str] = []
+            while self.frontier < self._produced_through and self._page_pending[self.frontier] <= 0:
+                for chunk_hash, chunk_id in self._page_log.pop(self.frontier, []):
+                    increments[chunk_hash] += 1
+                    committed.append(chunk_id)
+                self._page_pending.pop(self.frontier, None)
+                self.frontier += 1
+            if self.frontier == start:
+                return None
+            return self.frontier, dict(increments), committed
+
+    async def _commit(self, ids: List[str]) -> None:
+        async with self._commit_lock:
+            advanced = self._advance(ids)
+            if advanced and self.on_checkpoint:
+                await self.on_checkpoint(*advanced)
+
+    # --- Orchestration ---
+
+    @property
+    def seen_ids(self) -> List[str]:
+        return list(self._seen)
+
+    def _load_existing(self) -> None:
+        existing = self.vector_store.get(where={"source_doc_id": self.doc_id}, include=["metadatas"])
+        self._existing = {
+            chunk_id: metadata_fingerprint(meta or {})
+            for chunk_id, meta in zip(existing["ids"], existing["metadatas"])
+        }
+
+    async def run(self) -> Dict[str, int]:
+        await asyncio.to_thread(self._load_existing)
+
+        loop = asyncio.get_running_loop()
+        producer = loop.run_in_executor(None, self._produce)
+        stages = [asyncio.ensure_future(self._embed()), asyncio.ensure_future(self._upsert())]
+        try:
+            await asyncio.gather(producer, *stages)
+        except BaseException:
+            self._stop.set()
+            for stage in stages:
+                stage.cancel()
+            raise
+        await self._commit([]) # trailing pages without chunks
+
+        # Upserts happened first, so the document never disappears from search mid-update.
+        # A page-range run only sees part of the document; its coordinator deletes instead.
+        if self.delete_stale:
+            stale = [chunk_id for chunk_id in self._existing if chunk_id not in self._seen]
+            await asyncio.to_thread(delete_chunks, self.vector_store, self.lexical_index, stale)
+            self.stats["deleted"] = len(stale)
+
+        logger.info("document_chunks_replaced", doc_id=self.doc_id, **self.stats)
+        return self.stats
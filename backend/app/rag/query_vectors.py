@@ -0,0 +1,50 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+class QueryVectors:
+    """
+    Per-chat-turn memo of query embeddings.
+
+    Each distinct string is embedded once, however many stages (cache lookup,
+    retrieval, cache insertion) ask for it; concurrent callers share one request.
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self._embeddings = embeddings
+        self._vectors: Dict[str, asyncio.Future] = {}
+
+    async def get(self, text: str) -> List[float]:
+        future = self._vectors.get(text)
+        if future is None:
+            future = asyncio.ensure_future(self._embeddings.aembed_query(text))
+            self._vectors[text] = future
+        # A cancelled caller must not cancel the embedding other stages are waiting on
+        return await asyncio.shield(future)
+
+
+# --- By-vector Chroma operations (no re-embedding) ---
+
+async def search_by_vector(store, vector: List[float], k: int, filter: Optional[dict] = None) -> List[Document]:
+    return await asyncio.to_thread(store.similarity_search_by_vector, vector, k=k, filter=filter)
+
+async def search_by_vector_with_relevance(
+    store, vector: List[float], k: int, filter: Optional[dict] = None
+) -> List[Tuple[Document, float]]:
+    """
+    Like `similarity_search_with_relevance_scores`, but for a precomputed vector:
+    Chroma distances are normalised to [0, 1] relevance with the store's own function.
+    """
+    def _search():
+        hits = store.similarity_search_by_vector_with_relevance_scores(vector, k=k, filter=filter)
+        relevance = store._select_relevance_score_fn()
+        return [(doc, relevance(distance)) for doc, distance in hits]
+    return await asyncio.to_thread(_search)
+
+async def add_with_vector(store, id: str, text: str, vector: List[float], metadata: dict) -> None:
+    await asyncio.to_thread(
+        store._collection.upsert, ids=[id], embeddings=[vector], documents=[text], metadatas=[metadata]
+    )
@@ -0,0 +1,218 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import PackageNotFoundError, version
+from typing import Any, Dict, List, Optional, Tuple
+
+from flashrank import RerankRequest
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.rag.resources import resources
+
+
+class RerankOverloaded(RuntimeError):
+    """Raised when the rerank queue stays full past the enqueue timeout."""
+
+
+class RerankUnavailable(RuntimeError):
+    """Raised when the FlashRank model could not be loaded."""
+
+
+def _flashrank_batchable() -> bool:
+    # `_score_pairs` mirrors the pairwise path of FlashRank 0.2.x `Ranker.rerank`;
+    # other versions use the public API (one call per request) instead
+    try:
+        return version("flashrank").startswith("0.2.")
+    except PackageNotFoundError:
+        return False
+
+
+_BATCHABLE = _flashrank_batchable()
+
+
+class _Job:
+    __slots__ = ("query", "passages", "future")
+
+    def __init__(self, query: str, passages: List[dict], future: asyncio.Future):
+        self.query = query
+        self.passages = passages
+        self.future = future
+
+
+def _score_pairs(ranker, jobs: List[Tuple[str, List[dict]]]) -> Optional[List[float]]:
+    """
+    Score every (query, passage) pair of a micro-batch in one ONNX call.
+    Returns None when the loaded model is not a plain pairwise cross-encoder or the
+    installed FlashRank is not a version this was checked against, in which case the
+    caller falls back to one `ranker.rerank` per request.
+    """
+    if not _BATCHABLE:
+        return None
+    session = getattr(ranker, "session", None)
+    tokenizer = getattr(ranker, "tokenizer", None)
+    if session is None or tokenizer is None or getattr(ranker, "llm_model", None) is not None:
+        return None
+
+    import numpy as np
+
+    pairs = [[query, p["text"]] for query, passages in jobs for p in passages]
+    encoded = tokenizer.encode_batch(pairs)
+    input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+    attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+    token_type_ids = np.array([e.type_ids for e in encoded], dtype=np.int64)
+
+    onnx_input = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if not np.all(token_type_ids == 0):
+        onnx_input["token_type_ids"] = token_type_ids
+
+    logits = session.run(None, onnx_input)[0]
+    if logits.shape[1] == 1:
+        scores = 1 / (1 + np.exp(-logits.flatten()))
+    else:
+        exp_logits = np.exp(logits)
+        scores = exp_logits[:, 1] / np.sum(exp_logits, axis=1)
+    return [float(s) for s in scores]
+
+
+def _rerank_batch(jobs: List[Tuple[str, List[dict]]]) -> List[List[Dict[str, Any]]]:
+    """
+    Runs in the rerank thread pool: never on the event loop.
+    """
+    ranker = resources.get("ranker")
+    if ranker is None:
+        raise RerankUnavailable("FlashRank model is not loaded")
+
+    scores = None
+    if len(jobs) > 1:
+        try:
+            scores = _score_pairs(ranker, jobs)
+        except Exception as e:
+            logger.warning("rerank_batch_fallback", error=str(e))
+
+    results = []
+    if scores is None:
+        for query, passages in jobs:
+            ranked = ranker.rerank(RerankRequest(query=query, passages=passages))
+            for r in ranked:
+                if "score" in r:
+                    r["score"] = float(r["score"])
+            results.append(ranked)
+        return results
+
+    offset = 0
+    for _, passages in jobs:
+        ranked = [dict(p, score=scores[offset + i]) for i, p in enumerate(passages)]
+        offset += len(passages)
+        ranked.sort(key=lambda r: r["score"], reverse=True)
+        results.append(ranked)
+    return results
+
+
+class RerankService:
+    """
+    Awaitable FlashRank front-end that keeps the cross-encoder off the event loop.
+
+    Concurrent `rerank()` calls are queued, merged into micro-batches (up to
+    RERANK_MAX_BATCH requests, waiting at most RERANK_MAX_WAIT_MS for company) and
+    scored in a dedicated thread pool. A bounded queue provides backpressure:
+    callers that cannot enqueue within RERANK_ENQUEUE_TIMEOUT get RerankOverloaded.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.RERANK_WORKERS,
+        max_batch: int = settings.RERANK_MAX_BATCH,
+        max_wait_ms: int = settings.RERANK_MAX_WAIT_MS,
+        max_queue: int = settings.RERANK_MAX_QUEUE,
+        enqueue_timeout: float = settings.RERANK_ENQUEUE_TIMEOUT,
+    ):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._batcher: Optional[asyncio.Task] = None
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._batcher is not None and not self._batcher.done() and self._loop is loop:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rerank")
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._batcher = loop.create_task(self._run())
+
+    async def rerank(self, query: str, passages: List[dict]) -> List[Dict[str, Any]]:
+        """
+        Rerank passages for a query. Returns passages sorted by descending `score`.
+        """
+        if not passages:
+            return []
+        self._ensure_started()
+        job = _Job(query, passages, self._loop.create_future())
+        try:
+            await asyncio.wait_for(self._queue.put(job), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("rerank_overloaded", queued=self._queue.qsize())
+            raise RerankOverloaded("rerank queue is full")
+        return await job.future
+
+    async def _run(self) -> None:
+        while True:
+            job = await self._queue.get()
+            await self._slots.acquire()
+
+            # Give concurrent requests a short window to join this batch, but only
+            # while it is not yet full
+            batch = [job]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [j for j in batch if not j.future.done()]
+            if not batch:
+                self._slots.release()
+                continue
+            self._loop.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[_Job]) -> None:
+        try:
+            results = await self._loop.run_in_executor(
+                self._executor, _rerank_batch, [(j.query, j.passages) for j in batch]
+            )
+        except Exception as e:
+            for j in batch:
+                if not j.future.done():
+                    j.future.set_exception(e)
+        else:
+            for j, result in zip(batch, results):
+                if not j.future.done():
+                    j.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def close(self) -> None:
+        if self._batcher is not None:
+            self._batcher.cancel()
+            self._batcher = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+rerank_service = RerankService()
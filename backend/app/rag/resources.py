@@ -0,0 +1,253 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import chromadb
+from flashrank import Ranker
+from langchain_chroma import Chroma
+from langchain_community.tools import DuckDuckGoSearchRun
+from langchain_openai import OpenAIEmbeddings
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.rag.embedding_cache import CachedEmbeddings, build_embedding_store
+from app.rag.embedding_scheduler import EmbeddingScheduler
+from app.rag.lexical import LexicalIndex
+
+
+class ResourceUnavailable(RuntimeError):
+    """Raised when a required resource could not be built."""
+
+
+class _Spec:
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[["ResourceRegistry"], Any],
+        health_check: Optional[Callable[[Any], Any]] = None,
+        depends_on: Iterable[str] = (),
+        optional: bool = False,
+    ):
+        self.name = name
+        self.factory = factory
+        self.health_check = health_check
+        self.depends_on = tuple(depends_on)
+        self.optional = optional
+
+
+class ResourceRegistry:
+    """
+    Process-wide registry of expensive RAG clients (Chroma, embeddings, FlashRank, web search).
+
+    Resources are built lazily on first use (or eagerly via `warm_up`), reused across
+    requests/tasks, and rebuilt when a health check fails or a caller invalidates them.
+    Invalidating a resource also drops everything that depends on it.
+    """
+
+    def __init__(self):
+        self._specs: Dict[str, _Spec] = {}
+        self._instances: Dict[str, Any] = {}
+        self._status: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+
+    def register(
+        self,
+        name: str,
+        factory: Callable[["ResourceRegistry"], Any],
+        health_check: Optional[Callable[[Any], Any]] = None,
+        depends_on: Iterable[str] = (),
+        optional: bool = False,
+    ) -> None:
+        with self._lock:
+            self._specs[name] = _Spec(name, factory, health_check, depends_on, optional)
+            self._status[name] = {"state": "cold", "built_at": None, "build_ms": None, "error": None}
+
+    def get(self, name: str) -> Any:
+        """
+        Return the shared instance, building it if needed.
+        Optional resources return None instead of raising when they cannot be built.
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+
+            spec = self._specs[name]
+            status = self._status[name]
+            failed_at = status.get("failed_at")
+            if failed_at and time.monotonic() - failed_at < settings.RESOURCE_RETRY_BACKOFF:
+                if spec.optional:
+                    return None
+                raise ResourceUnavailable(f"{name}: {status['error']}")
+
+            started = time.perf_counter()
+            try:
+                instance = spec.factory(self)
+            except Exception as e:
+                status.update(state="failed", error=str(e), failed_at=time.monotonic())
+                logger.error("resource_build_failed", resource=name, error=str(e))
+                if spec.optional:
+                    return None
+                raise ResourceUnavailable(f"{name}: {e}") from e
+
+            build_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._instances[name] = instance
+            status.update(
+                state="ready",
+                error=None,
+                failed_at=None,
+                build_ms=build_ms,
+                built_at=datetime.now(timezone.utc).isoformat(),
+            )
+            logger.info("resource_built", resource=name, build_ms=build_ms)
+            return instance
+
+    def override(self, name: str, instance: Any) -> None:
+        """
+        Use `instance` instead of building `name` (e.g. a local stand-in in tests).
+        `invalidate()` or `reset()` drops the override again.
+        """
+        with self._lock:
+            self._instances[name] = instance
+            self._status[name].update(
+                state="ready",
+                error=None,
+                failed_at=None,
+                build_ms=0.0,
+                built_at=datetime.now(timezone.utc).isoformat(),
+            )
+
+    def invalidate(self, name: str, error: Optional[str] = None) -> None:
+        """
+        Drop a broken instance (and its dependents) so the next `get` rebuilds it.
+        """
+        with self._lock:
+            self._instances.pop(name, None)
+            status = self._status[name]
+            status.update(state="failed" if error else "cold", error=error)
+            for dependent in self._specs.values():
+                if name in dependent.depends_on:
+                    self.invalidate(dependent.name, error=f"dependency {name} invalidated")
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        """
+        Build the given resources (all by default). Failures are recorded, not raised.
+        """
+        for name in names or list(self._specs):
+            try:
+                self.get(name)
+            except ResourceUnavailable:
+                pass
+        return self.status()
+
+    def check(self) -> Dict[str, dict]:
+        """
+        Run health checks on built resources, rebuilding any that fail.
+        """
+        for name, spec in list(self._specs.items()):
+            instance = self._instances.get(name)
+            if instance is None or spec.health_check is None:
+                continue
+            try:
+                spec.health_check(instance)
+            except Exception as e:
+                logger.warning("resource_unhealthy", resource=name, error=str(e))
+                self.invalidate(name, error=str(e))
+                try:
+                    self.get(name)
+                except ResourceUnavailable:
+                    pass
+        return self.status()
+
+    def reset(self) -> None:
+        """
+        Forget all instances, e.g. in a freshly forked worker process.
+        """
+        with self._lock:
+            self._instances.clear()
+            for name in self._specs:
+                self._status[name] = {"state": "cold", "built_at": None, "build_ms": None, "error": None}
+
+    def status(self) -> Dict[str, dict]:
+        return {
+            name: {k: v for k, v in status.items() if k != "failed_at"}
+            for name, status in self._status.items()
+        }
+
+    def is_warm(self, names: Optional[Iterable[str]] = None) -> bool:
+        return all(self._status[name]["state"] == "ready" for name in names or self._specs)
+
+
+async def run_health_checks(registry: "ResourceRegistry", interval: int) -> None:
+    """
+    Background loop that periodically health-checks (and repairs) the registry.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(registry.check)
+        except Exception as e:
+            logger.error("resource_health_check_failed", error=str(e))
+
+
+# --- Resource factories ---
+
+def _build_chroma_client(registry: ResourceRegistry):
+    return chromadb.HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)
+
+def _build_embeddings(registry: ResourceRegistry):
+    # Retries are owned by the scheduler so it can see (and adapt to) every 429
+    embeddings = EmbeddingScheduler(
+        OpenAIEmbeddings(
+            model=settings.EMBEDDING_MODEL,
+            dimensions=settings.EMBEDDING_DIMENSIONS,
+            openai_api_key=settings.OPENAI_API_KEY,
+            max_retries=0
+        ),
+        settings.EMBEDDING_MODEL,
+    )
+    store = build_embedding_store()
+    if store is None:
+        return embeddings
+    return CachedEmbeddings(embeddings, store, settings.EMBEDDING_MODEL, settings.EMBEDDING_DIMENSIONS)
+
+def _build_vector_store(registry: ResourceRegistry):
+    return Chroma(
+        client=registry.get("chroma_client"),
+        collection_name="rag_collection",
+        embedding_function=registry.get("embeddings"),
+    )
+
+def _build_cache_store(registry: ResourceRegistry):
+    return Chroma(
+        client=registry.get("chroma_client"),
+        collection_name="semantic_cache",
+        embedding_function=registry.get("embeddings"),
+    )
+
+def _build_lexical_index(registry: ResourceRegistry):
+    return LexicalIndex(settings.LEXICAL_INDEX_PATH)
+
+def _build_ranker(registry: ResourceRegistry):
+    return Ranker(model_name=settings.RANKER_MODEL, cache_dir=settings.RANKER_CACHE_DIR)
+
+def _build_web_search(registry: ResourceRegistry):
+    return DuckDuckGoSearchRun()
+
+
+resources = ResourceRegistry()
+resources.register("chroma_client", _build_chroma_client, health_check=lambda c: c.heartbeat())
+resources.register("embeddings", _build_embeddings)
+resources.register("vector_store", _build_vector_store, depends_on=("chroma_client", "embeddings"))
+resources.register("cache_store", _build_cache_store, depends_on=("chroma_client", "embeddings"))
+resources.register("lexical_index", _build_lexical_index, optional=True)
+resources.register("ranker", _build_ranker, optional=True)
+resources.register("web_search", _build_web_search, optional=True)
+
+# Resources needed by ingestion workers (the API process warms everything)
+WORKER_RESOURCES = ("chroma_client", "embeddings", "vector_store", "lexical_index")
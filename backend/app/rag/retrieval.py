@@ -1,56 +1,53 @@
-from typing import List, AsyncGenerator
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from typing import Dict, Iterable, List, AsyncGenerator, Tuple
+import asyncio
+from contextlib import aclosing
+from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.documents import Document
 from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.prompts import PromptTemplate
-from flashrank import Ranker, RerankRequest
-import json
+from sqlalchemy.future import select
 
 from app.core.config import settings
-from langchain_community.tools import DuckDuckGoSearchRun
+from app.db.models import Blob, Document as DocumentRecord
+from app.db.session import AsyncSessionLocal
+from app.rag.ingestion import get_vector_store
+from app.rag.resources import resources
+from app.rag.reranker import rerank_service
+from app.rag.lexical import fuse
+from app.rag.query_vectors import QueryVectors, search_by_vector_with_relevance
+from app.rag.answer_cache import answer_cache
+from app.rag.stages import StageScheduler
+from app.rag.single_flight import FlightFailed, chat_flights
+from app.rag.web_search import web_search
+from app.core.logging import logger
+from app.core.metrics import metrics
 
-# Initialize Reranker (Lazy)
+# Shared Reranker (built once per process by the resource registry; web search: app/rag/web_search.py)
 def get_ranker():
-    try:
-        return Ranker(model_name="ms-marco-MiniLM-L-12-v2", cache_dir="/app/.cache")
-    except Exception as e:
-        print(f"Failed to load Ranker: {e}")
-        return None
-
-# Initialize Web Search (Lazy)
-# Initialize Web Search (Lazy)
-def get_web_search():
-    try:
-        return DuckDuckGoSearchRun()
-    except Exception as e:
-        print(f"Failed to load Web Search: {e}")
-        return None
+    return resources.get("ranker")
 
 # Initialize LLM (Lazy or safe global? ChatOpenAI usually safe but let's be consistent)
 # Actually ChatOpenAI is lightweight config. Keep global or lazy. Let's keep global for now to avoid re-init overhead if not needed.
 llm = ChatOpenAI(
-    model_name="gpt-4o", # Using 4o as per plan
+    model_name=settings.CHAT_MODEL, # gpt-4o as per plan
     temperature=0,
     openai_api_key=settings.OPENAI_API_KEY,
     streaming=True
 )
 
-# Initialize Cache Store (Lazy load inside function or here but protected)
-import chromadb
-from app.rag.ingestion import get_vector_store
-
 def get_cache_store():
-    # Reuse client logic roughly or new (Chroma HTTP client is thread safe usually)
-    chroma_client = chromadb.HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)
-    return Chroma(
-        collection_name="semantic_cache",
-        embedding_function=OpenAIEmbeddings(api_key=settings.OPENAI_API_KEY, model="text-embedding-3-small"),
-        client=chroma_client
-    )
+    return resources.get("cache_store")
 
-CACHE_THRESHOLD = 0.90
+async def lexical_search(query: str) -> List[Tuple[Document, float]]:
+    lexical_index = resources.get("lexical_index")
+    if lexical_index is None:
+        return []
+    try:
+        return await asyncio.to_thread(lexical_index.search, query, settings.RETRIEVAL_K)
+    except Exception as e:
+        logger.warning("lexical_search_failed", error=str(e))
+        return []
 
 CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template("""Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language.
 
@@ -77,42 +74,176 @@ class StreamingCallbackHandler(BaseCallbackHandler):
 async def chat_stream(
     question: str,
     chat_history: List[tuple],
+    owner_id: int = 0,
 ):
-    # Lazy Init
+    """
+    Answer a question as a stream of (event, data) pairs: ("sources", [names]) first,
+    then ("token", text) for the answer (see app/core/sse.py for the wire format).
+    """
+    # Shared clients (warmed at startup, reused across requests)
     vector_store = get_vector_store()
-    cache_store = get_cache_store()
-    ranker = get_ranker()
-    web_search = get_web_search()
 
-    # 0. Check Semantic Cache
+    # Each distinct query string is embedded once per turn and the vector reused
+    # for the semantic cache tier, retrieval and cache insertion
+    query_vectors = QueryVectors(vector_store.embeddings)
+
+    # Cache lookup, condensation and retrieval are independent enough to overlap;
+    # the scheduler cancels whichever of them turn out not to be needed
+    stages = StageScheduler()
+    flight, leads = None, False
     try:
-        # Search properly for 1 nearest neighbor
-        cached_docs = await cache_store.asimilarity_search_with_relevance_scores(question, k=1)
-        if cached_docs:
-            doc, score = cached_docs[0]
-            if score > CACHE_THRESHOLD:
-                # HIT! Yield cached answer
-                # Yield dummy source to keep frontend happy
-                yield json.dumps({"type": "sources", "data": ["Semantic Cache"]}) + "\n\n"
-                yield doc.metadata.get("answer", "")
-                return
-    except Exception as e:
-        print(f"Cache Error: {e}")
+        # 0. Check Answer Cache (in-process / Redis exact match, then semantic), by the
+        # standalone question that answers are stored under
+        async def cache_lookup(query: str):
+            try:
+                return await answer_cache.lookup(owner_id, query, lambda: query_vectors.get(query))
+            except Exception as e:
+                logger.warning("answer_cache_lookup_failed", error=str(e))
+                return None
+
+        async def condensed_cache_lookup():
+            return await cache_lookup(await stages.result("condense"))
+
+        # 1. Retrieve initial candidates (Top 20 per retriever, fused by reciprocal rank)
+        async def vector_search(query: str) -> List[Tuple[Document, float]]:
+            return await search_by_vector_with_relevance(
+                vector_store, await query_vectors.get(query), settings.RETRIEVAL_K
+            )
+
+        async def hybrid_search(query: str):
+            vector_hits, lexical_hits = await asyncio.gather(vector_search(query), lexical_search(query))
+            return fuse(
+                [doc for doc, _ in vector_hits],
+                lexical_hits,
+                settings.HYBRID_CANDIDATES,
+                vector_relevance=vector_hits[0][1] if vector_hits else None,
+            )
+
+        # 2. Condense Question
+        async def condense() -> str:
+            history_str = "\n".join([f"User: {h[0]}\nAssistant: {h[1]}" for h in chat_history])
+            chain = CONDENSE_QUESTION_PROMPT | llm
+            response = await chain.ainvoke({"chat_history": history_str, "question": question})
+            return response.content
+
+        # Speculative: without history the raw question *is* the standalone question, and
+        # with history the condensed question frequently comes back unchanged
+        stages.start("retrieve", hybrid_search(question))
+        if chat_history:
+            stages.start("condense", condense())
+            stages.start("cache", condensed_cache_lookup())
+        else:
+            stages.start("cache", cache_lookup(question))
+
+        cached = await stages.result("cache")
+        if cached:
+            # HIT! Yield cached answer with the sources it was originally built from
+            yield "sources", cached.sources
+            yield "token", cached.answer
+            return
+
+        standalone_question = question
+        if chat_history:
+            standalone_question = await stages.result("condense")
+            if standalone_question != question:
+                # Speculation lost: retrieve for the rewritten question instead
+                metrics.incr("chat_stages.retrieve.respeculated")
+                stages.start("retrieve", hybrid_search(standalone_question))
+
+        # Join an identical question that is already being answered, if any
+        if settings.SINGLE_FLIGHT_ENABLED:
+            version = await answer_cache.corpus_version()
+            flight, leads = await chat_flights.join(chat_flights.key(owner_id, version, standalone_question))
+            if not leads:
+                stages.cancel("retrieve")
+
+        # 3. Get Context (vector + BM25) & Rerank
+        hybrid = None
+        if flight is None or leads:
+            hybrid = await stages.result("retrieve")
+        if leads:
+            # Produced in a task of its own, so followers are not tied to this client
+            chat_flights.lead(flight, answer_stream(standalone_question, hybrid, owner_id, query_vectors))
+    except BaseException as e:
+        # A leader stopped (failed or cancelled) before producing: release its followers
+        if leads and flight.task is None:
+            chat_flights.fail(flight, f"leader failed: {e!r}")
+        raise
+    finally:
+        await stages.close()
+
+    if flight is None:
+        async with aclosing(answer_stream(standalone_question, hybrid, owner_id, query_vectors)) as events:
+            async for event in events:
+                yield event
+        return
+
+    received = False
+    try:
+        async with aclosing(chat_flights.stream(flight)) as events:
+            async for event in events:
+                received = True
+                yield event
+        return
+    except FlightFailed as e:
+        if leads or received:
+            raise
+        # Nothing replayed yet: answer on our own instead
+        metrics.incr("single_flight.fallbacks")
+        logger.info("single_flight_fallback", error=str(e))
+
+    hybrid = await hybrid_search(standalone_question)
+    async with aclosing(answer_stream(standalone_question, hybrid, owner_id, query_vectors)) as events:
+        async for event in events:
+            yield event
+
+async def owner_source_names(owner_id: int, index_doc_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    The owner's own filename for each index document. Chunks of shared content carry
+    the name given by whoever uploaded it first.
+    """
+    ids = {i for i in index_doc_ids if i is not None}
+    if not ids:
+        return {}
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Blob.index_doc_id, DocumentRecord.filename)
+            .join(DocumentRecord, DocumentRecord.sha256 == Blob.sha256)
+            .where(Blob.index_doc_id.in_(ids), DocumentRecord.owner_id == owner_id)
+            .order_by(DocumentRecord.id)
+        )
+        names: Dict[int, str] = {}
+        for index_doc_id, filename in result:
+            names.setdefault(index_doc_id, filename)
+        return names
+
+async def answer_stream(standalone_question: str, hybrid, owner_id: int, query_vectors: QueryVectors):
+    """
+    Rerank the retrieved candidates, pick the context (local or web) and stream
+    ("sources", ...) and ("token", ...) events; a complete answer is cached.
+    """
+    # Weak vector hits make the web fallback likely: start it now, alongside reranking
+    search = None
+    if web_search.available() and (
+        not hybrid.docs
+        or (hybrid.vector_relevance is not None and hybrid.vector_relevance < settings.WEB_SEARCH_SPECULATE_BELOW)
+    ):
+        metrics.incr("web_search.speculative")
+        search = web_search.start(standalone_question)
+    try:
+        async with aclosing(_answer_stream(standalone_question, hybrid, owner_id, query_vectors, search)) as events:
+            async for event in events:
+                yield event
+    finally:
+        # Not awaited (failed, abandoned or local context won): stop waiting on it; the
+        # provider call itself still finishes into the cache
+        if search is not None and not search.done():
+            search.cancel()
+
+async def _answer_stream(standalone_question: str, hybrid, owner_id: int, query_vectors: QueryVectors, search):
+    ranker = get_ranker()
+    docs = hybrid.docs
 
-    # 1. Retrieve initial candidates (Top 20)
-    retriever = vector_store.as_retriever(search_kwargs={"k": 20})
-    
-    # 2. Condense Question
-    standalone_question = question
-    if chat_history:
-        history_str = "\n".join([f"User: {h[0]}\nAssistant: {h[1]}" for h in chat_history])
-        chain = CONDENSE_QUESTION_PROMPT | llm
-        response = await chain.ainvoke({"chat_history": history_str, "question": question})
-        standalone_question = response.content
-
-    # 3. Get Context & Rerank
-    docs = await retriever.ainvoke(standalone_question)
-    
     # Rerank with FlashRank
     passages = [
         {"id": str(i), "text": doc.page_content, "meta": doc.metadata} 
@@ -122,16 +253,19 @@ async def chat_stream(
     # Handle empty docs case
     reranked_results = []
     if passages:
-        if ranker:
+        if hybrid.agreed:
+            # Both retrievers agree on the top hits; reranking would not change the context
+            reranked_results = [{"text": d.page_content, "meta": d.metadata, "score": 1.0} for d in docs]
+        elif ranker:
             try:
-                 rerank_request = RerankRequest(query=standalone_question, passages=passages)
-                 reranked_results = ranker.rerank(rerank_request)
+                 # Scored off the event loop, micro-batched with concurrent chats
+                 reranked_results = await rerank_service.rerank(standalone_question, passages)
             except Exception as e:
-                 print(f"Rerank Error: {e}")
+                 logger.warning("rerank_failed", error=str(e))
                  # Fallback to original docs if rerank fails (e.g. empty)
                  reranked_results = [{"text": d.page_content, "meta": d.metadata, "score": 1.0} for d in docs]
         else:
-             print("Ranker not available. Skipping reranking.")
+             logger.info("rerank_skipped", reason="ranker_unavailable")
              reranked_results = [{"text": d.page_content, "meta": d.metadata, "score": 1.0} for d in docs]
     
     # Hybrid Logic: Check Relevance
@@ -142,48 +276,57 @@ async def chat_stream(
     
     
     if use_web_search:
-        if web_search:
-            try:
-                print(f"Low relevance ({top_score:.2f}). Falling back to Web Search.")
-                web_context = web_search.run(standalone_question)
+        if web_search.available():
+            logger.info("web_search_fallback", top_score=round(top_score, 2))
+            # Time-boxed: None once WEB_SEARCH_TIMEOUT has passed since the search started
+            web_context = await (search or web_search.start(standalone_question))
+            if web_context is not None:
                 context_str = f"web_search_results:\n{web_context}"
-                sources = ["DuckDuckGo Search"]
-            except Exception as e:
+                sources = [web_search.source_name()]
+            else:
                  # Fallback to local even if weak if web fails
-                 print(f"Web Search failed: {e}")
                  if reranked_results:
                     top_docs = reranked_results[:5]
                     context_str = "\n\n".join([r["text"] for r in top_docs])
                  else:
                     context_str = "No relevant context found."
         else:
-             print("Web Search not available. Skipping.")
+             logger.info("web_search_skipped", reason="web_search_unavailable")
              if reranked_results:
                 top_docs = reranked_results[:5]
                 context_str = "\n\n".join([r["text"] for r in top_docs])
              else:
                 context_str = "No relevant context found."
     else:
+        if search is not None and not search.done():
+            # Speculation lost; the provider call still finishes into the cache
+            search.cancel()
+            metrics.incr("web_search.speculation_unused")
         # Take top 5 local
         top_docs = reranked_results[:5]
         context_str = "\n\n".join([r["text"] for r in top_docs])
         
-        # Extract Sources
+        # Extract Sources (named as this user uploaded them)
+        try:
+            names = await owner_source_names(owner_id, [r.get("meta", {}).get("source_doc_id") for r in top_docs])
+        except Exception as e:
+            logger.warning("source_names_failed", error=str(e))
+            names = {}
         seen_sources = set()
         for r in top_docs:
             meta = r.get("meta", {})
-            source_name = meta.get("source", "Unknown Document")
+            source_name = names.get(meta.get("source_doc_id")) or meta.get("source", "Unknown Document")
             if source_name not in seen_sources:
                  sources.append(source_name)
                  seen_sources.add(source_name)
 
-    # 4. Stream Sources First (as special JSON line)
-    yield json.dumps({"type": "sources", "data": sources}) + "\n\n"
+    # 4. Stream Sources First
+    yield "sources", sources
 
     # 5. Generate Answer Stream
     if context_str == "No relevant context found.":
         # Fallback to General Chat Mode (No RAG constraints)
-        print("No context found. Switching to General Chat Mode.")
+        logger.info("general_chat_fallback", reason="no_context")
         messages = [
             HumanMessage(content=standalone_question)
         ]
@@ -193,15 +336,21 @@ async def chat_stream(
             HumanMessage(content=QA_PROMPT.format(context=context_str, question=standalone_question))
         ]
     
+    # Closed explicitly, so an abandoned turn aborts the LLM request right away
     full_answer = ""
-    async for chunk in llm.astream(messages):
-        full_answer += chunk.content
-        yield chunk.content
+    async with aclosing(llm.astream(messages)) as stream:
+        async for chunk in stream:
+            full_answer += chunk.content
+            yield "token", chunk.content
         
-    # 6. Save to Cache
+    # 6. Save to Cache (reusing the vector computed for retrieval)
     try:
-        await cache_store.aadd_documents([
-            Document(page_content=standalone_question, metadata={"answer": full_answer})
-        ])
+        await answer_cache.store(
+            owner_id,
+            standalone_question,
+            await query_vectors.get(standalone_question),
+            full_answer,
+            sources,
+        )
     except Exception as e:
-        print(f"Cache Save Error: {e}")
+        logger.warning("answer_cache_store_failed", error=str(e))
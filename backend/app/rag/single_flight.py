@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.core.redis_client import get_redis
+from app.rag.answer_cache import normalize_question
+
+Event = Tuple[str, Any]
+_END = "end" # terminal record in the Redis replay list: ["end", error or null]
+
+# Renew (ARGV[2] = ttl) or release (ARGV[2] = 0) a lease, but only while it is still ours
+_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    if ARGV[2] == '0' then
+        return redis.call('del', KEYS[1])
+    end
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class FlightFailed(RuntimeError):
+    """The flight ended without a complete answer (its producer failed, was abandoned or vanished)."""
+
+
+class Flight:
+    """
+    One answer being generated: the events produced so far (kept for replay to late
+    subscribers) and the task producing them. In the leading process the task runs
+    the pipeline; elsewhere it relays the leader's events from Redis.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.nonce = uuid.uuid4().hex # names this flight's replay list and channel in Redis
+        self.leader = True
+        self.events: List[Event] = []
+        self.done = False
+        self.error: Optional[str] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def _notify(self) -> None:
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    def publish(self, event: Event) -> None:
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error: Optional[str] = None) -> None:
+        if self.done:
+            return
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def replay(self) -> AsyncIterator[Event]:
+        i = 0
+        while True:
+            if i < len(self.events):
+                event = self.events[i]
+                i += 1
+                yield event
+                continue
+            if self.done:
+                if self.error:
+                    raise FlightFailed(self.error)
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.SINGLE_FLIGHT_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise FlightFailed("flight stopped responding")
+
+
+class SingleFlight:
+    """
+    Coalesces identical chat questions that are answered at the same time.
+
+    The first request for a key leads: it claims a Redis lease and runs the pipeline
+    in a task of its own. Concurrent duplicates in the same process subscribe to that
+    flight directly; duplicates in other processes find the lease taken and relay the
+    leader's events, which it appends to a Redis list (replay for late joiners) and
+    announces on a pub/sub channel. Every subscriber sees the full event stream from
+    the start.
+
+    The lease holds the flight's nonce, which namespaces its replay list and channel:
+    a new flight for the same key never replays what an earlier one left behind.
+
+    A leader whose subscribers all disconnect is cancelled unless other processes
+    are still following it. A flight that fails before a follower received anything
+    lets that follower answer on its own (see `chat_stream`).
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def key(owner_id: int, version: int, question: str) -> str:
+        digest = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        return f"{owner_id}:{version}:{digest}"
+
+    @staticmethod
+    def _redis_keys(flight: Flight) -> Tuple[str, str, str, str]:
+        lease = f"flight:{flight.key}"
+        base = f"{lease}:{flight.nonce}"
+        return lease, f"{base}:events", f"{base}:subs", f"{base}:channel"
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def _forget(self, flight: Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    # --- Joining ---
+
+    async def join(self, key: str) -> Tuple[Flight, bool]:
+        """
+        The flight for `key` and whether the caller leads it. A leading caller must
+        follow up with `lead()` (or `fail()` if it cannot produce the answer).
+        """
+        flight = self._flights.get(key)
+        if flight is not None and not flight.done:
+            metrics.incr("single_flight.followers_local")
+            return flight, False
+
+        flight = Flight(key) # registered before the first await: local duplicates join it
+        self._flights[key] = flight
+        try:
+            claimed = await self._claim(flight)
+        except BaseException:
+            # Cancelled before the caller learnt its role: nobody would ever lead this flight
+            self.fail(flight, "abandoned")
+            raise
+        if claimed:
+            metrics.incr("single_flight.leaders")
+            return flight, True
+
+        flight.leader = False
+        flight.task = self._spawn(self._relay(flight))
+        metrics.incr("single_flight.followers_remote")
+        return flight, False
+
+    async def _claim(self, flight: Flight) -> bool:
+        """
+        Take the lease with this flight's nonce, or adopt the nonce of the flight
+        that holds it (and follow that one).
+        """
+        lease, _, _, _ = self._redis_keys(flight)
+        redis = get_redis()
+        try:
+            for _ in range(3):
+                if await redis.set(lease, flight.nonce, nx=True, ex=settings.SINGLE_FLIGHT_LEASE_TTL):
+                    return True
+                current = await redis.get(lease)
+                if current:
+                    flight.nonce = current
+                    return False
+                # The lease expired in between: try again
+        except Exception as e:
+            logger.warning("single_flight_redis_failed", error=str(e))
+        return True # coalesce within this process only
+
+    # --- Leading ---
+
+    def lead(self, flight: Flight, events: AsyncIterator[Event]) -> None:
+        flight.task = self._spawn(self._produce(flight, events))
+
+    def fail(self, flight: Flight, error: str) -> None:
+        """
+        The leader could not start producing: release followers and the lease.
+        """
+        flight.finish(error)
+        self._forget(flight)
+        self._spawn(self._pump(flight))
+
+    async def _produce(self, flight: Flight, events: AsyncIterator[Event]) -> None:
+        pump = self._spawn(self._pump(flight))
+        try:
+            async for event in events:
+                flight.publish(event)
+            flight.finish()
+        except asyncio.CancelledError:
+            flight.finish("abandoned")
+            raise
+        except Exception as e:
+            logger.exception("single_flight_producer_failed", error=str(e))
+            flight.finish(str(e))
+        finally:
+            self._forget(flight)
+            aclose = getattr(events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            await asyncio.gather(pump, return_exceptions=True)
+
+    async def _pump(self, flight: Flight) -> None:
+        """
+        Mirror a leader's events to Redis in batches, for followers in other processes.
+        """
+        lease, events_key, _, channel = self._redis_keys(flight)
+        redis = get_redis()
+        sent = 0
+        try:
+            while True:
+                wakeup = flight._wakeup
+                batch = flight.events[sent:]
+                done = flight.done
+                if batch or done:
+                    records = [json.dumps(e) for e in batch]
+                    if done:
+                        records.append(json.dumps([_END, flight.error]))
+                    async with redis.pipeline(transaction=True) as pipe:
+                        pipe.rpush(events_key, *records)
+                        pipe.expire(events_key, settings.SINGLE_FLIGHT_REPLAY_TTL)
+                        pipe.eval(_LEASE_SCRIPT, 1, lease, flight.nonce, 0 if done else settings.SINGLE_FLIGHT_LEASE_TTL)
+                        pipe.publish(channel, len(records))
+                        await pipe.execute()
+                    sent += len(batch)
+                if done:
+                    return
+                await wakeup.wait()
+        except Exception as e:
+            # Followers elsewhere stop hearing from us and time out (SINGLE_FLIGHT_WAIT_TIMEOUT)
+            logger.warning("single_flight_publish_failed", error=str(e))
+
+    # --- Following another process ---
+
+    async def _relay(self, flight: Flight) -> None:
+        _, events_key, subs_key, channel = self._redis_keys(flight)
+        redis = get_redis()
+        pubsub = redis.pubsub()
+        try:
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.incr(subs_key)
+                pipe.expire(subs_key, settings.SINGLE_FLIGHT_LEASE_TTL)
+                await pipe.execute()
+            await pubsub.subscribe(channel)
+            index = 0
+            last_event = time.monotonic()
+            while True:
+                # The list is authoritative; notifications only say when to look again
+                for raw in await redis.lrange(events_key, index, -1):
+                    index += 1
+                    last_event = time.monotonic()
+                    event, data = json.loads(raw)
+                    if event == _END:
+                        flight.finish(data)
+                        return
+                    flight.publish((event, data))
+                if time.monotonic() - last_event > settings.SINGLE_FLIGHT_WAIT_TIMEOUT:
+                    flight.finish("leader stopped responding")
+                    return
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+        except asyncio.CancelledError:
+            flight.finish("abandoned")
+            raise
+        except Exception as e:
+            logger.warning("single_flight_relay_failed", error=str(e))
+            flight.finish(str(e))
+        finally:
+            self._forget(flight)
+            try:
+                await redis.decr(subs_key)
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    # --- Subscribing ---
+
+    async def stream(self, flight: Flight) -> AsyncIterator[Event]:
+        """
+        All events of the flight, from the first; raises FlightFailed if it fails.
+        """
+        flight.subscribers += 1
+        try:
+            async for event in flight.replay():
+                yield event
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done and flight.task is not None:
+                if flight.leader:
+                    self._spawn(self._cancel_if_unwatched(flight))
+                else:
+                    flight.task.cancel()
+
+    async def _cancel_if_unwatched(self, flight: Flight) -> None:
+        _, _, subs_key, _ = self._redis_keys(flight)
+        try:
+            remote = int(await get_redis().get(subs_key) or 0)
+        except Exception:
+            remote = 0
+        if remote <= 0 and flight.subscribers == 0 and not flight.done:
+            metrics.incr("single_flight.abandoned")
+            flight.task.cancel()
+
+
+chat_flights = SingleFlight()
@@ -0,0 +1,59 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Dict
+
+from app.core.logging import logger
+from app.core.metrics import metrics
+
+
+class StageScheduler:
+    """
+    Runs the independent stages of one chat turn as concurrent tasks.
+
+    Stages are started as soon as their inputs are known (speculatively, when their
+    result is only likely to be needed), awaited where the pipeline needs them and
+    cancelled when they lose. Everything still running is cancelled by `close()`, so a
+    turn never leaves background work behind.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started: Dict[str, float] = {}
+        self._timings: Dict[str, float] = {}
+
+    def start(self, name: str, coro: Awaitable[Any]) -> asyncio.Task:
+        if name in self._tasks:
+            self.cancel(name)
+        self._started[name] = time.perf_counter()
+        task = asyncio.ensure_future(coro)
+        task.add_done_callback(lambda t, name=name: self._finished(name, t))
+        self._tasks[name] = task
+        return task
+
+    def _finished(self, name: str, task: asyncio.Task) -> None:
+        if task.cancelled():
+            metrics.incr(f"chat_stages.{name}.cancelled")
+        elif name in self._started:
+            self._timings[name] = round((time.perf_counter() - self._started[name]) * 1000, 1)
+
+    def running(self, name: str) -> bool:
+        task = self._tasks.get(name)
+        return task is not None and not task.done()
+
+    async def result(self, name: str) -> Any:
+        return await self._tasks[name]
+
+    def cancel(self, name: str) -> None:
+        task = self._tasks.pop(name, None)
+        if task and not task.done():
+            task.cancel()
+
+    async def close(self) -> None:
+        pending = [t for t in self._tasks.values() if not t.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks.clear()
+        if self._timings:
+            logger.info("chat_stage_timings", **{f"{k}_ms": v for k, v in self._timings.items()})
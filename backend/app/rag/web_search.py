@@ -0,0 +1,100 @@
+import asyncio
+from typing import Dict, Optional, Protocol, runtime_checkable
+
+from app.core.config import settings
+from app.core.executors import run_vendor
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.core.ttl_cache import TTLCache
+from app.rag.answer_cache import normalize_question
+from app.rag.resources import resources
+
+
+@runtime_checkable
+class SearchProvider(Protocol):
+    """
+    What the web-search fallback needs from a provider: a blocking `run(query)`
+    returning result text (LangChain search tools qualify). An optional
+    `source_name` attribute is shown to users as the answer's source.
+
+    The provider is the "web_search" resource; tests can substitute a local
+    stand-in with `resources.override("web_search", provider)`.
+    """
+
+    def run(self, query: str) -> str:
+        ...
+
+
+class WebSearch:
+    """
+    Time-boxed, cached web search for low-relevance questions.
+
+    Provider calls run in the vendor pool; a caller waits at most WEB_SEARCH_TIMEOUT
+    seconds from the moment the search was started and gets None after that (or on
+    any provider error), so the answer falls back to local context. Results are cached
+    by normalized query for WEB_SEARCH_CACHE_TTL, including results of searches that
+    finished after their caller gave up, and concurrent identical searches share one
+    provider call.
+    """
+
+    def __init__(
+        self,
+        timeout: float = settings.WEB_SEARCH_TIMEOUT,
+        cache_size: int = settings.WEB_SEARCH_CACHE_SIZE,
+        cache_ttl: float = settings.WEB_SEARCH_CACHE_TTL,
+    ):
+        self.timeout = timeout
+        self._cache = TTLCache(cache_size, cache_ttl)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def provider() -> Optional[SearchProvider]:
+        return resources.get("web_search")
+
+    def source_name(self) -> str:
+        return getattr(self.provider(), "source_name", "DuckDuckGo Search")
+
+    def available(self) -> bool:
+        return self.provider() is not None
+
+    def start(self, query: str) -> asyncio.Task:
+        """
+        Launch a search now (e.g. speculatively) and await the task when the result
+        is needed; its deadline runs from here.
+        """
+        return asyncio.ensure_future(self.search(query))
+
+    async def search(self, query: str) -> Optional[str]:
+        provider = self.provider()
+        if provider is None:
+            return None
+        key = normalize_question(query)
+        hit = self._cache.get(key)
+        if hit is not None:
+            metrics.incr("web_search.cache_hits")
+            return hit
+
+        future = self._in_flight.get(key)
+        if future is None:
+            metrics.incr("web_search.calls")
+            future = asyncio.ensure_future(run_vendor(provider.run, query))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f, key=key: self._finished(key, f))
+        try:
+            # Shielded: a caller that times out or is cancelled leaves the call to finish (and be cached)
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            metrics.incr("web_search.timeouts")
+            logger.warning("web_search_timeout", timeout=self.timeout)
+        except Exception as e:
+            metrics.incr("web_search.errors")
+            logger.warning("web_search_failed", error=str(e))
+        return None
+
+    def _finished(self, key: str, future: asyncio.Future) -> None:
+        self._in_flight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self._cache.set(key, future.result())
+
+
+web_search = WebSearch()
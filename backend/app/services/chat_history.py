@@ -0,0 +1,95 @@
+import json
+from typing import List, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.core.redis_client import get_redis
+from app.core.tokens import TokenCounter
+from app.db.models import ChatMessage
+from app.services.message_buffer import message_buffer
+
+_tokens = TokenCounter(settings.CHAT_MODEL)
+
+
+def _key(session_id: int) -> str:
+    return f"chat:history:{session_id}"
+
+
+def _as_history(messages: List[dict]) -> List[tuple]:
+    """
+    Newest messages that fit HISTORY_TOKEN_BUDGET, oldest first, in the
+    (user, assistant) tuple shape `chat_stream` expects.
+    """
+    kept, used = [], 0
+    for m in reversed(messages):
+        cost = _tokens.count(m["content"])
+        if kept and used + cost > settings.HISTORY_TOKEN_BUDGET:
+            break
+        kept.append(m)
+        used += cost
+    return [(m["content"], "") if m["role"] == "user" else ("", m["content"]) for m in reversed(kept)]
+
+
+async def load_history(db: AsyncSession, session_id: int) -> List[tuple]:
+    """
+    Recent history of a chat session, served from the Redis window when it is warm
+    and rebuilt from Postgres (one indexed query) when it is not.
+    """
+    key = _key(session_id)
+    try:
+        raw = await get_redis().lrange(key, 0, -1)
+        if raw:
+            metrics.incr("chat_history.hits")
+            return _as_history([json.loads(r) for r in raw])
+    except Exception as e:
+        logger.warning("chat_history_redis_failed", error=str(e))
+
+    metrics.incr("chat_history.misses")
+    result = await db.execute(
+        select(ChatMessage.role, ChatMessage.content)
+        .where(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        .limit(settings.HISTORY_MAX_MESSAGES)
+    )
+    messages = [{"role": role, "content": content} for role, content in reversed(result.all())]
+    # Plus anything still waiting in the write-behind buffer
+    messages += [{"role": m["role"], "content": m["content"]} for m in message_buffer.pending_for(session_id)]
+    messages = messages[-settings.HISTORY_MAX_MESSAGES:]
+
+    if messages:
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.rpush(key, *[json.dumps(m) for m in messages])
+                pipe.expire(key, settings.HISTORY_CACHE_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("chat_history_redis_failed", error=str(e))
+    return _as_history(messages)
+
+
+async def append_message(session_id: int, role: str, content: str, create: bool = False) -> None:
+    """
+    Write-through of a persisted message. Only extends a window that already exists
+    (RPUSHX): a cold session is rebuilt from Postgres on its next load instead.
+    `create` starts the window, for the first message of a new session (whose whole
+    history it is), so that session's next turn is served from Redis too.
+    """
+    key = _key(session_id)
+    record = json.dumps({"role": role, "content": content})
+    try:
+        async with get_redis().pipeline(transaction=True) as pipe:
+            if create:
+                pipe.delete(key)
+                pipe.rpush(key, record)
+            else:
+                pipe.rpushx(key, record)
+            pipe.ltrim(key, -settings.HISTORY_MAX_MESSAGES, -1)
+            pipe.expire(key, settings.HISTORY_CACHE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("chat_history_redis_failed", error=str(e))
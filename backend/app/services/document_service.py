@@ -1,48 +1,298 @@
 import os
-import shutil
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 from fastapi import UploadFile, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.future import select
-from app.db.models import Document, User
+from app.db.models import Blob, Document
+from app.core.principals import Principal
 from app.core.config import settings
-from app.worker import process_document_task # Will implement this task next
+from app.core.executors import run_io
+from app.core.logging import logger
+from app.services.upload_storage import StoredUpload, discard_upload, place_upload, store_upload
+from app.worker import ingest_queue, process_document_task
+from app.rag.answer_cache import answer_cache
 
-UPLOAD_DIR = "/app/uploads" # For now storing locally in container
+async def link_blob(db: AsyncSession, stored: StoredUpload, doc_id: int) -> Blob:
+    """
+    Take a reference on the blob for `stored`, creating it (indexed under `doc_id`)
+    if this content has not been seen before. The blob row stays locked until commit.
+    """
+    stmt = (
+        pg_insert(Blob)
+        .values(
+            sha256=stored.sha256,
+            path=stored.path,
+            size_bytes=stored.size,
+            ref_count=1,
+            status="pending",
+            index_doc_id=doc_id,
+        )
+        .on_conflict_do_update(index_elements=[Blob.sha256], set_={"ref_count": Blob.ref_count + 1})
+        .returning(Blob)
+    )
+    return (await db.execute(stmt)).scalars().one()
 
-async def save_upload_file(upload_file: UploadFile, user: User, db: AsyncSession) -> Document:
-    # 1. Create upload dir if not exists
-    if not os.path.exists(UPLOAD_DIR):
-        os.makedirs(UPLOAD_DIR)
+async def store_blob_file(blob: Blob, stored: StoredUpload) -> None:
+    """
+    Keep one file per blob. An upload of content that is already stored (possibly
+    named with another extension) is dropped; otherwise it becomes the blob's file.
+    Call it while holding the blob row lock (see `place_upload`).
+    """
+    if blob.path != stored.path and await run_io(os.path.exists, blob.path):
+        await discard_upload(stored)
+        return
+    await place_upload(stored)
+    blob.path = stored.path
 
-    # 2. Save file to disk (or S3 in future)
-    file_path = os.path.join(UPLOAD_DIR, f"{user.id}_{upload_file.filename}")
-    
+async def ingestion_stalled(db: AsyncSession, blob: Blob, doc_id: int) -> bool:
+    """
+    Whether the unfinished ingestion of `blob` that `doc_id` would wait on has shown
+    no progress for INGEST_STALL_TIMEOUT (e.g. its task was lost with a broker).
+    """
+    last_activity = func.coalesce(Document.progress_updated_at, Document.processing_started_at, Document.created_at)
+    result = await db.execute(
+        select(func.max(last_activity)).where(
+            Document.sha256 == blob.sha256, Document.status != "indexed", Document.id != doc_id
+        )
+    )
+    latest = result.scalar()
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=settings.INGEST_STALL_TIMEOUT)
+    return latest is None or latest < stale_before
+
+async def release_blob(db: AsyncSession, sha256: str) -> None:
+    """
+    Remove a blob's file and row once nothing references it. The row lock keeps an
+    upload of the same content from placing its file in between; if one linked the
+    blob meanwhile, both are kept.
+    """
+    result = await db.execute(select(Blob).where(Blob.sha256 == sha256).with_for_update())
+    blob = result.scalars().first()
+    if blob is None or blob.ref_count > 0:
+        await db.commit()
+        return
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
+        await run_io(os.remove, blob.path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error("blob_file_delete_failed", path=blob.path, error=str(e))
+        await db.commit()
+        return
+    await db.delete(blob)
+    await db.commit()
+
+def ingestion_progress(document: Document) -> dict:
+    """
+    Progress of a document's ingestion as reported by the worker, with throughput
+    (pages/s over the current run) and the ETA it implies.
+    """
+    pages_per_second = None
+    eta_seconds = None
+    if document.processing_started_at and document.progress_updated_at and document.pages_processed:
+        elapsed = (document.progress_updated_at - document.processing_started_at).total_seconds()
+        if elapsed > 0:
+            pages_per_second = document.pages_processed / elapsed
+            if document.status == "processing" and document.pages_total:
+                remaining = max(document.pages_total - document.pages_processed, 0)
+                eta_seconds = round(remaining / pages_per_second)
+            pages_per_second = round(pages_per_second, 2)
+    return {
+        "pages_total": document.pages_total,
+        "pages_processed": document.pages_processed,
+        "chunks_indexed": document.chunks_indexed,
+        "pages_per_second": pages_per_second,
+        "eta_seconds": eta_seconds,
+    }
+
+async def save_upload_file(upload_file: UploadFile, user: Principal, db: AsyncSession) -> Document:
+    # 1. Stream file to content-addressed storage (or S3 in future)
+    try:
+        stored = await store_upload(upload_file)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Could not save file")
 
-    # 3. Create DB record
-    db_document = Document(
-        title=upload_file.filename,
-        filename=upload_file.filename,
-        s3_key=file_path, # Using local path as key for now
-        media_type=upload_file.content_type,
-        owner_id=user.id,
-        status="pending"
-    )
-    db.add(db_document)
-    await db.commit()
+    # 2. Create DB record, linked to the (possibly already indexed) blob
+    try:
+        db_document = Document(
+            title=upload_file.filename,
+            filename=upload_file.filename,
+            s3_key=stored.path, # Using local path as key for now
+            media_type=upload_file.content_type,
+            size_bytes=stored.size,
+            owner_id=user.id,
+            status="pending"
+        )
+        db.add(db_document)
+        await db.flush()
+        blob = await link_blob(db, stored, db_document.id)
+        await store_blob_file(blob, stored)
+        db_document.sha256 = blob.sha256
+        db_document.s3_key = blob.path
+
+        if blob.ref_count == 1 and blob.index_doc_id != db_document.id:
+            # Every earlier reference was deleted (chunks included) just before we linked it
+            blob.index_doc_id = db_document.id
+            blob.status = "pending"
+        if blob.status == "indexed":
+            # Same bytes already embedded: nothing to parse, embed or store
+            db_document.status = "indexed"
+            needs_ingestion = False
+        elif blob.status == "failed":
+            blob.status = "pending"
+            needs_ingestion = True
+        elif blob.index_doc_id == db_document.id:
+            # New content
+            needs_ingestion = True
+        else:
+            # An ingestion already under way will mark this document too, unless it was lost
+            needs_ingestion = await ingestion_stalled(db, blob, db_document.id)
+        await db.commit()
+    except BaseException:
+        await discard_upload(stored)
+        raise
     await db.refresh(db_document)
 
-    # 4. Trigger Async Job
-    process_document_task.delay(db_document.id, file_path)
+    if needs_ingestion:
+        # 3. Trigger Async Job
+        process_document_task.apply_async(
+            (db_document.id, blob.path), queue=ingest_queue(stored.size)
+        )
+
+        # 4. Corpus changed: retire cached answers
+        await answer_cache.invalidate()
 
     return db_document
 
-async def delete_document(doc_id: int, user: User, db: AsyncSession):
+async def new_index_doc_id(db: AsyncSession) -> int:
+    """
+    Reserve an index document id that no document or blob uses yet (drawn from the
+    documents id sequence, so it can never collide with a later upload).
+    """
+    return (await db.execute(text("SELECT nextval(pg_get_serial_sequence('documents', 'id'))"))).scalar_one()
+
+async def replace_document(doc_id: int, upload_file: UploadFile, user: Principal, db: AsyncSession) -> Optional[Document]:
+    """
+    Replace a document's file, keeping its id. When nothing else shares the old content,
+    the new content is indexed under the old index document: chunk IDs are content-based,
+    so ingestion embeds and upserts only the chunks that changed and deletes the stale
+    ones. Content shared with other documents stays theirs, and the new version gets an
+    index document of its own. Identical content leaves the document as is.
+    Returns None if the document does not exist.
+    """
+    # 1. Get Document (locked: one replace at a time)
+    result = await db.execute(
+        select(Document).where(Document.id == doc_id, Document.owner_id == user.id).with_for_update()
+    )
+    document = result.scalars().first()
+    if not document:
+        return None
+    if document.status not in ("indexed", "failed"):
+        raise HTTPException(status_code=409, detail="Document is still being processed")
+
+    # 2. Stream the new file to content-addressed storage
+    try:
+        stored = await store_upload(upload_file)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Could not save file")
+
+    # 3. Move this document's reference from the old blob to the new one
+    from app.rag.ingestion import delete_document_from_vector_store
+    old = None
+    corpus_changed = False
+    try:
+        if document.sha256:
+            result = await db.execute(select(Blob).where(Blob.sha256 == document.sha256).with_for_update())
+            old = result.scalars().first()
+        if old is not None and old.sha256 == stored.sha256:
+            await discard_upload(stored)
+            await db.commit()
+            return document
+
+        if old is not None and old.ref_count == 1 and old.status == "indexed":
+            # Only ours and fully indexed (no checkpoints left): its chunks are the diff baseline
+            index_doc_id = old.index_doc_id
+        elif old is None:
+            # Legacy / pre-dedup upload: chunks indexed under the document's own id
+            index_doc_id = document.id
+        else:
+            index_doc_id = await new_index_doc_id(db)
+        blob = await link_blob(db, stored, index_doc_id)
+        await store_blob_file(blob, stored)
+        if blob.ref_count == 1 and blob.index_doc_id != index_doc_id:
+            # Every earlier reference was deleted (chunks included) just before we linked it
+            blob.index_doc_id = index_doc_id
+            blob.status = "pending"
+        reuses_index = blob.ref_count == 1 and blob.index_doc_id == index_doc_id
+
+        # Old chunks go unless the new content is diffed against them
+        if old is not None:
+            old.ref_count -= 1
+            if old.ref_count <= 0 and not (reuses_index and old.index_doc_id == index_doc_id):
+                await run_io(delete_document_from_vector_store, old.index_doc_id)
+                corpus_changed = True
+        elif not reuses_index:
+            await run_io(delete_document_from_vector_store, document.id)
+            corpus_changed = True
+
+        legacy_path = document.s3_key if old is None else None
+        document.title = upload_file.filename
+        document.filename = upload_file.filename
+        document.media_type = upload_file.content_type
+        document.size_bytes = stored.size
+        document.sha256 = blob.sha256
+        document.s3_key = blob.path
+        document.error_message = None
+        document.pages_total = document.pages_processed = document.chunks_indexed = None
+        document.processing_started_at = document.progress_updated_at = None
+        document.status = "pending"
+        if blob.status == "indexed":
+            document.status = "indexed"
+            needs_ingestion = False
+        elif blob.status == "failed":
+            blob.status = "pending"
+            needs_ingestion = True
+        elif reuses_index:
+            needs_ingestion = True
+        else:
+            needs_ingestion = await ingestion_stalled(db, blob, document.id)
+        await db.commit()
+    except BaseException:
+        await discard_upload(stored)
+        raise
+    await db.refresh(document)
+
+    # 4. Delete the old file once nothing references it
+    if old is not None:
+        if old.ref_count <= 0:
+            await release_blob(db, old.sha256)
+    elif legacy_path and legacy_path != blob.path:
+        # Legacy upload with a file of its own
+        try:
+            await run_io(os.remove, legacy_path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error("document_file_delete_failed", path=legacy_path, error=str(e))
+
+    if needs_ingestion:
+        process_document_task.apply_async(
+            (document.id, blob.path), queue=ingest_queue(stored.size)
+        )
+
+    # 5. Corpus changed: retire cached answers
+    if needs_ingestion or corpus_changed:
+        await answer_cache.invalidate()
+
+    return document
+
+async def delete_document(doc_id: int, user: Principal, db: AsyncSession):
     # 1. Get Document
     result = await db.execute(select(Document).where(Document.id == doc_id, Document.owner_id == user.id))
     document = result.scalars().first()
@@ -50,19 +300,46 @@ async def delete_document(doc_id: int, user: User, db: AsyncSession):
     if not document:
         return False
 
-    # 2. Delete from Vector DB (Chroma)
+    # 2. Drop this document's reference on its blob
     from app.rag.ingestion import delete_document_from_vector_store
-    delete_document_from_vector_store(doc_id)
+    blob = None
+    if document.sha256:
+        # Locked until commit: an upload linking the same blob waits for the new count
+        result = await db.execute(select(Blob).where(Blob.sha256 == document.sha256).with_for_update())
+        blob = result.scalars().first()
+        if blob is not None:
+            blob.ref_count -= 1
+    last_reference = blob is None or blob.ref_count <= 0
 
-    # 3. Delete File from Disk
-    if document.s3_key and os.path.exists(document.s3_key):
-        try:
-            os.remove(document.s3_key)
-        except Exception as e:
-            print(f"Error deleting file {document.s3_key}: {e}")
+    # 3. Delete from Vector DB (Chroma): shared chunks only with the last reference
+    corpus_changed = False
+    if blob is not None and last_reference:
+        await run_io(delete_document_from_vector_store, blob.index_doc_id)
+        corpus_changed = True
+    if blob is None or blob.index_doc_id != document.id:
+        # Chunks indexed under this document's own id (legacy / pre-dedup uploads)
+        await run_io(delete_document_from_vector_store, doc_id)
+        corpus_changed = True
 
-    # 4. Delete from DB
+    # 4. Delete from DB (the blob row goes with its file, once committed)
     await db.delete(document)
     await db.commit()
+
+    # 5. Delete File from Disk once nothing references it
+    if blob is not None:
+        if last_reference:
+            await release_blob(db, blob.sha256)
+    elif document.s3_key:
+        # Legacy upload with a file of its own
+        try:
+            await run_io(os.remove, document.s3_key)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error("document_file_delete_failed", path=document.s3_key, error=str(e))
+
+    # 6. Corpus changed: retire cached answers
+    if corpus_changed:
+        await answer_cache.invalidate()
     
     return True
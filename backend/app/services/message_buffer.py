@@ -0,0 +1,191 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, func, insert, update
+from sqlalchemy.exc import InterfaceError, OperationalError, StatementError
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.db.models import ChatMessage, ChatSession
+from app.db.session import AsyncSessionLocal
+
+
+def _unavailable(e: Exception) -> bool:
+    """
+    The database could not be reached (as opposed to rejecting what was sent).
+    """
+    if isinstance(e, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)):
+        return True
+    return bool(getattr(e, "connection_invalidated", False))
+
+
+class MessageBuffer:
+    """
+    Write-behind persistence for chat messages and session activity.
+
+    Messages are queued in process and written by a background flusher as one
+    multi-row INSERT (plus one batched session UPDATE) per transaction, whenever
+    MESSAGE_BUFFER_FLUSH_SIZE messages are waiting or every MESSAGE_BUFFER_FLUSH_INTERVAL
+    seconds. When MESSAGE_BUFFER_MAX_PENDING messages are already waiting, callers write
+    synchronously instead. `close()` flushes everything that is left on shutdown.
+
+    Messages are timestamped when queued, so history order does not depend on when
+    they are flushed.
+
+    A batch the database rejects (or that keeps failing for MESSAGE_BUFFER_MAX_RETRIES
+    flushes) is split in halves until the offending rows are found; those are logged and
+    dropped so they cannot block everyone else's messages. While the database is
+    unreachable, batches are kept and retried.
+    """
+
+    def __init__(self):
+        self._pending: List[dict] = []
+        self._in_flight: List[dict] = []
+        self._sessions: Dict[int, dict] = {}
+        self._failures = 0 # consecutive failed flushes
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    # --- Lifecycle ---
+
+    def start(self) -> None:
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            # Let the flusher finish the write it may be in the middle of, then exit
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error("message_buffer_unflushed", messages=len(self._pending))
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.MESSAGE_BUFFER_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("message_buffer_flush_failed", error=str(e))
+
+    # --- Writes ---
+
+    async def add_message(self, session_id: int, role: str, content: str) -> None:
+        message = {
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "created_at": datetime.now(timezone.utc),
+        }
+        if self._task is None or len(self._pending) >= settings.MESSAGE_BUFFER_MAX_PENDING:
+            # Not running (e.g. outside the API process) or backed up: write through
+            metrics.incr("message_buffer.sync_writes")
+            await self._write([message], {session_id: {"sid": session_id, "ts": message["created_at"]}})
+            return
+
+        self._pending.append(message)
+        self._sessions[session_id] = {"sid": session_id, "ts": message["created_at"]}
+        metrics.set_gauge("message_buffer.pending", len(self._pending))
+        if len(self._pending) >= settings.MESSAGE_BUFFER_FLUSH_SIZE:
+            self._wakeup.set()
+
+    def pending_for(self, session_id: int) -> List[dict]:
+        """
+        Queued (not yet committed) messages of a session, oldest first.
+        """
+        return [m for m in self._in_flight + self._pending if m["session_id"] == session_id]
+
+    async def flush(self) -> None:
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._in_flight, self._pending = self._pending, []
+            sessions, self._sessions = self._sessions, {}
+            try:
+                try:
+                    await self._write(self._in_flight, sessions)
+                    metrics.incr("message_buffer.flushed_messages", len(self._in_flight))
+                except Exception as e:
+                    self._failures += 1
+                    if _unavailable(e) or (
+                        not isinstance(e, StatementError) and self._failures < settings.MESSAGE_BUFFER_MAX_RETRIES
+                    ):
+                        raise
+                    unwritten = await self._isolate(self._in_flight, sessions)
+                    if unwritten:
+                        self._in_flight = unwritten
+                        raise
+                metrics.incr("message_buffer.flushes")
+                self._failures = 0
+            except BaseException:
+                # Keep the batch (ahead of anything queued meanwhile) for the next attempt,
+                # also when cancelled mid-write
+                self._pending = self._in_flight + self._pending
+                for sid, values in sessions.items():
+                    self._sessions.setdefault(sid, values)
+                raise
+            finally:
+                self._in_flight = []
+                metrics.set_gauge("message_buffer.pending", len(self._pending))
+
+    async def _isolate(self, messages: List[dict], sessions: Dict[int, dict]) -> List[dict]:
+        """
+        Write a failing batch in ever smaller parts, dropping single rows that still
+        fail. Returns the messages left unwritten if the database becomes unreachable.
+        """
+        parts = [messages]
+        while parts:
+            part = parts.pop(0)
+            try:
+                part_sessions = {m["session_id"]: sessions[m["session_id"]] for m in part if m["session_id"] in sessions}
+                await self._write(part, part_sessions)
+                metrics.incr("message_buffer.flushed_messages", len(part))
+            except Exception as e:
+                if _unavailable(e):
+                    return [m for p in [part] + parts for m in p]
+                if len(part) > 1:
+                    middle = len(part) // 2
+                    parts[:0] = [part[:middle], part[middle:]]
+                    continue
+                message = part[0]
+                metrics.incr("message_buffer.dropped")
+                logger.error(
+                    "message_buffer_message_dropped",
+                    session_id=message["session_id"],
+                    role=message["role"],
+                    created_at=message["created_at"].isoformat(),
+                    error=str(e),
+                )
+        return []
+
+    @staticmethod
+    async def _write(messages: List[dict], sessions: Dict[int, dict]) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(ChatMessage), messages)
+            await db.execute(
+                update(ChatSession.__table__)
+                .where(ChatSession.__table__.c.id == bindparam("sid"))
+                .values(updated_at=func.greatest(ChatSession.__table__.c.updated_at, bindparam("ts"))),
+                list(sessions.values()),
+            )
+            await db.commit()
+
+
+message_buffer = MessageBuffer()
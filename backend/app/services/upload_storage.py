@@ -0,0 +1,85 @@
+import hashlib
+import os
+import uuid
+
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import settings
+from app.core.executors import run_io
+
+UPLOAD_DIR = "/app/uploads" # For now storing locally in container
+_TMP_DIR = os.path.join(UPLOAD_DIR, ".incoming")
+
+
+class StoredUpload:
+    def __init__(self, path: str, sha256: str, size: int, tmp_path: str):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.tmp_path = tmp_path # where the upload waits until `place_upload`
+
+
+def blob_path(sha256: str, filename: str) -> str:
+    # The extension is kept so loaders can still be picked by file type
+    ext = os.path.splitext(filename)[1].lower()
+    return os.path.join(UPLOAD_DIR, f"{sha256}{ext}")
+
+
+def _write_chunk(out, digest, chunk: bytes) -> None:
+    # Hashing a multi-megabyte chunk takes milliseconds: keep it off the event loop too
+    digest.update(chunk)
+    out.write(chunk)
+
+
+async def store_upload(upload_file: UploadFile, max_bytes: int = settings.UPLOAD_MAX_BYTES) -> StoredUpload:
+    """
+    Stream an upload to disk in chunks, hashing as it is written. The file is staged
+    under a temporary name; `place_upload` moves it to its content-hash path with an
+    atomic rename (so readers never see a partial upload and identical content is
+    stored once), or `discard_upload` drops it.
+    """
+    if upload_file.size is not None and upload_file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte limit")
+
+    await run_io(os.makedirs, _TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(_TMP_DIR, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    out = await run_io(open, tmp_path, "wb")
+    try:
+        try:
+            while chunk := await upload_file.read(settings.UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File exceeds the {max_bytes} byte limit")
+                await run_io(_write_chunk, out, digest, chunk)
+            await run_io(out.flush)
+            await run_io(os.fsync, out.fileno())
+        finally:
+            await run_io(out.close)
+
+        sha256 = digest.hexdigest()
+        final_path = blob_path(sha256, upload_file.filename or "")
+    except BaseException:
+        try:
+            await run_io(os.remove, tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return StoredUpload(final_path, sha256, size, tmp_path)
+
+
+async def place_upload(stored: StoredUpload) -> None:
+    """
+    Move a staged upload to its content-hash path. Call it while holding the blob row
+    lock, so it cannot interleave with the removal of the same content's file.
+    """
+    await run_io(os.replace, stored.tmp_path, stored.path)
+
+
+async def discard_upload(stored: StoredUpload) -> None:
+    try:
+        await run_io(os.remove, stored.tmp_path)
+    except OSError:
+        pass
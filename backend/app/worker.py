@@ -1,11 +1,24 @@
-from celery import Celery
+from celery import Celery, chord, group
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
 import asyncio
-from asgiref.sync import async_to_sync
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import update
 from sqlalchemy.future import select
 from app.core.config import settings
-from app.db.session import AsyncSessionLocal
-from app.db.models import Document
-from app.rag.ingestion import ingest_document
+from app.core.loop_thread import LoopThread
+from app.db.session import AsyncSessionLocal, configure_worker_engine
+from app.db.models import Blob, Document
+from app.core.redis_client import get_redis
+from app.core.logging import logger
+from app.core.metrics import metrics
+from app.rag.checkpoints import checkpoints
+from app.rag.pipeline import Checkpoint
+from app.rag.ingestion import count_pages, finalize_document, ingest_document, ingest_page_range, page_ranges
+from app.rag.resources import resources, WORKER_RESOURCES
+from app.rag.answer_cache import answer_cache
 
 celery_app = Celery(
     "worker",
@@ -13,14 +26,269 @@ celery_app = Celery(
     backend=f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/0"
 )
 
+MAIN_QUEUE = "main-queue"
+PRIORITY_QUEUE = "priority-queue" # small documents and chord callbacks; has a worker of its own
+
 celery_app.conf.task_routes = {
-    "app.worker.process_document_task": "main-queue"
+    "app.worker.process_document_task": MAIN_QUEUE,
+    "app.worker.ingest_range_task": MAIN_QUEUE,
+    "app.worker.finalize_document_task": PRIORITY_QUEUE,
+    "app.worker.ingest_failed_task": PRIORITY_QUEUE,
 }
+# Ingestion mostly waits on I/O, so by default one process runs several documents at
+# once: Celery threads hand their coroutines to a single long-lived event loop.
+celery_app.conf.worker_pool = settings.WORKER_POOL
+celery_app.conf.worker_concurrency = settings.WORKER_CONCURRENCY
+celery_app.conf.worker_prefetch_multiplier = 1 # acks_late: don't hoard unstarted tasks
+
+# Per-process event loop shared by all tasks (and their loop-bound clients)
+worker_loop = LoopThread("ingest-loop")
+_ingest_slots: Optional[asyncio.Semaphore] = None
+
+@worker_process_init.connect
+def init_worker_resources(**kwargs):
+    """
+    Build the shared ingestion clients once per (forked) worker process.
+    Runs in a background thread so a slow Chroma start does not trip Celery's
+    process-init timeout; tasks that arrive earlier simply wait on the registry lock.
+    The database engine is rebuilt too: pooled connections must never cross a fork.
+    """
+    configure_worker_engine()
+    resources.reset()
+    threading.Thread(target=resources.warm_up, args=(WORKER_RESOURCES,), daemon=True).start()
+
+@worker_init.connect
+def init_worker(sender=None, **kwargs):
+    # Non-forking pools (threads, solo) run tasks in this process: set it up here instead
+    pool_cls = getattr(sender, "pool_cls", None)
+    pool_name = pool_cls if isinstance(pool_cls, str) else getattr(pool_cls, "__module__", "")
+    if "prefork" not in str(pool_name):
+        init_worker_resources()
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def stop_worker_loop(**kwargs):
+    worker_loop.stop()
+
+async def run_limited(coro):
+    """
+    Run an ingestion coroutine on the worker loop, at most WORKER_CONCURRENCY at a time.
+    """
+    global _ingest_slots
+    if _ingest_slots is None:
+        _ingest_slots = asyncio.Semaphore(settings.WORKER_CONCURRENCY)
+    async with _ingest_slots:
+        return await coro
+
+async def set_status(db, document: Document, blob: Optional[Blob], status: str, error: Optional[str] = None):
+    """
+    Set the ingestion status of a document, or of its blob and every (not yet indexed)
+    document linked to it.
+    """
+    if blob is None:
+        document.status = status
+        document.error_message = error
+        return
+    blob.status = status
+    await db.execute(
+        update(Document)
+        .where(linked_documents(document, blob))
+        .values(status=status, error_message=error)
+        .execution_options(synchronize_session=False)
+    )
+
+def linked_documents(document: Document, blob: Optional[Blob]):
+    """
+    The documents whose ingestion state follows this one: itself, or every (not yet
+    indexed) document sharing its blob.
+    """
+    if blob is None:
+        return Document.id == document.id
+    return (Document.sha256 == blob.sha256) & (Document.status != "indexed")
+
+async def load_document(db, doc_id: int):
+    result = await db.execute(select(Document).where(Document.id == doc_id))
+    document = result.scalars().first()
+    blob = await db.get(Blob, document.sha256) if document and document.sha256 else None
+    return document, blob
+
+async def mark_failed(doc_id: int, error: str):
+    async with AsyncSessionLocal() as db:
+        document, blob = await load_document(db, doc_id)
+        if document:
+            await set_status(db, document, blob, "failed", error=error)
+            await db.commit()
+
+# --- Per-user fairness: cap the range tasks one user runs at once across all workers ---
+
+def _active_key(owner_id: int) -> str:
+    return f"ingest:active:{owner_id}"
+
+# A user's slots are leases in a sorted set scored by expiry, so the slot of a task
+# whose worker died frees itself after INGEST_SLOT_LEASE_TTL however busy the user is.
+# KEYS[1] = set; ARGV = now, expiry, lease id, max active, set TTL
+_ACQUIRE_SLOT_SCRIPT = """
+redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[1])
+if not redis.call('zscore', KEYS[1], ARGV[3]) then
+    if redis.call('zcard', KEYS[1]) >= tonumber(ARGV[4]) then
+        return 0
+    end
+end
+redis.call('zadd', KEYS[1], ARGV[2], ARGV[3])
+redis.call('expire', KEYS[1], ARGV[5])
+return 1
+"""
+
+async def acquire_user_slot(owner_id: int, lease_id: str) -> bool:
+    now = time.time()
+    ttl = settings.INGEST_SLOT_LEASE_TTL
+    acquired = await get_redis().eval(
+        _ACQUIRE_SLOT_SCRIPT, 1, _active_key(owner_id),
+        now, now + ttl, lease_id, settings.INGEST_MAX_ACTIVE_PER_USER, ttl,
+    )
+    return bool(acquired)
+
+async def release_user_slot(owner_id: int, lease_id: str) -> None:
+    await get_redis().zrem(_active_key(owner_id), lease_id)
+
+# --- Checkpoints and progress ---
+
+def _progress_key(index_doc_id: int) -> str:
+    return f"ingest:progress:{index_doc_id}"
+
+def _fanout_key(doc_id: int) -> str:
+    return f"ingest:fanout:{doc_id}"
+
+class IngestProgress:
+    """
+    Checkpoint and progress bookkeeping for one ingestion task (a whole document, or
+    one page range of a fanned-out one).
+
+    Each commit-frontier advance is saved as a checkpoint first, so a redelivered task
+    resumes after it. Progress is kept per range in Redis (absolute values, so a
+    resumed range overwrites rather than double counts) and its totals are copied to
+    every linked document at most every INGEST_PROGRESS_INTERVAL seconds.
+    """
+
+    def __init__(self, document: Document, blob: Optional[Blob], index_doc_id: int, range_start: int = 0,
+                 pages_total: Optional[int] = None):
+        self.document = document
+        self.blob = blob
+        self.index_doc_id = index_doc_id
+        self.range_start = range_start
+        self.pages_total = pages_total
+        self.checkpoint = Checkpoint()
+        self.pages = 0
+        self.chunks = 0
+        self._checkpointing = True
+        self._last_write = 0.0
+
+    async def load(self) -> Checkpoint:
+        try:
+            self.checkpoint = await checkpoints.load(self.index_doc_id, self.range_start)
+        except Exception as e:
+            logger.warning("ingest_checkpoint_load_failed", doc_id=self.index_doc_id, error=str(e))
+            self.checkpoint = Checkpoint()
+        self.pages = self.checkpoint.next_page
+        self.chunks = len(self.checkpoint.committed_ids)
+        if self.checkpoint.next_page:
+            metrics.incr("ingest.resumed")
+            logger.info("ingest_resumed", doc_id=self.index_doc_id, range_start=self.range_start,
+                        next_page=self.checkpoint.next_page, chunks=self.chunks)
+        return self.checkpoint
+
+    async def on_checkpoint(self, next_page: int, increments: Dict[str, int], committed_ids: List[str]) -> None:
+        if self._checkpointing:
+            try:
+                await checkpoints.save(self.index_doc_id, self.range_start, next_page, increments, committed_ids)
+            except Exception as e:
+                # Later increments alone would leave an inconsistent resume point: keep the last good one
+                self._checkpointing = False
+                logger.warning("ingest_checkpoint_save_failed", doc_id=self.index_doc_id, error=str(e))
+        self.pages = next_page
+        self.chunks += len(committed_ids)
+        if time.monotonic() - self._last_write >= settings.INGEST_PROGRESS_INTERVAL:
+            await self.report()
+
+    async def report(self) -> None:
+        self._last_write = time.monotonic()
+        try:
+            redis = get_redis()
+            key = _progress_key(self.index_doc_id)
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping={f"p:{self.range_start}": self.pages, f"c:{self.range_start}": self.chunks})
+                pipe.expire(key, settings.INGEST_CHECKPOINT_TTL)
+                pipe.hgetall(key)
+                state = (await pipe.execute())[-1]
+            pages = sum(int(v) for k, v in state.items() if k.startswith("p:"))
+            chunks = sum(int(v) for k, v in state.items() if k.startswith("c:"))
+            if self.pages_total is not None:
+                pages = min(pages, self.pages_total) # non-PDF loaders may yield several "pages"
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Document)
+                    .where(linked_documents(self.document, self.blob))
+                    .values(pages_processed=pages, chunks_indexed=chunks, progress_updated_at=datetime.now(timezone.utc))
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except Exception as e:
+            # Progress is informational; never fail an ingestion over it
+            logger.warning("ingest_progress_write_failed", doc_id=self.index_doc_id, error=str(e))
+
+    async def clear_checkpoint(self) -> None:
+        try:
+            await checkpoints.clear(self.index_doc_id, self.range_start)
+        except Exception as e:
+            logger.warning("ingest_checkpoint_clear_failed", doc_id=self.index_doc_id, error=str(e))
+
+async def start_progress(db, document: Document, blob: Optional[Blob], index_doc_id: int, pages_total: int):
+    """
+    Reset the progress of a processing run. Resumed tasks report their checkpointed
+    progress again right after loading it.
+    """
+    await get_redis().delete(_progress_key(index_doc_id))
+    await db.execute(
+        update(Document)
+        .where(linked_documents(document, blob))
+        .values(
+            pages_total=pages_total,
+            pages_processed=0,
+            chunks_indexed=0,
+            processing_started_at=datetime.now(timezone.utc),
+            progress_updated_at=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+async def finish_progress(db, document: Document, blob: Optional[Blob], index_doc_id: int, chunks: int):
+    await get_redis().delete(_progress_key(index_doc_id))
+    await db.execute(
+        update(Document)
+        .where(linked_documents(document, blob))
+        .values(
+            pages_processed=Document.pages_total,
+            chunks_indexed=chunks,
+            progress_updated_at=datetime.now(timezone.utc),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def ingest_queue(size_bytes: Optional[int]) -> str:
+    """
+    Small uploads take the priority lane so they are never stuck behind big ones.
+    """
+    if size_bytes is not None and size_bytes <= settings.INGEST_PRIORITY_MAX_BYTES:
+        return PRIORITY_QUEUE
+    return MAIN_QUEUE
 
 @celery_app.task(acks_late=True)
 def process_document_task(doc_id: int, file_path: str):
     """
     Async task to process document ingestion.
+    Large PDFs are fanned out as a chord of page-range tasks and finished by
+    `finalize_document_task`; everything else is ingested here in one go.
+    A redelivered task resumes from its last checkpoint (see IngestProgress).
     """
     async def _process():
         async with AsyncSessionLocal() as db:
@@ -28,10 +296,10 @@ def process_document_task(doc_id: int, file_path: str):
             log = logger.bind(task="process_document", doc_id=doc_id)
             
             document = None
+            blob = None
             try:
-                # 1. Get Document
-                result = await db.execute(select(Document).where(Document.id == doc_id))
-                document = result.scalars().first()
+                # 1. Get Document (and the blob it shares with identical uploads)
+                document, blob = await load_document(db, doc_id)
                 if not document:
                     log.warning("document_not_found")
                     return
@@ -39,27 +307,153 @@ def process_document_task(doc_id: int, file_path: str):
                 log.info("processing_started", filename=document.filename)
 
                 # 2. Update status to processing
-                document.status = "processing"
+                index_doc_id = blob.index_doc_id if blob else doc_id
+                n_pages = await asyncio.to_thread(count_pages, file_path)
+                fan_out = n_pages > settings.INGEST_SPLIT_MIN_PAGES
+                if fan_out and await get_redis().exists(_fanout_key(doc_id)):
+                    # Redelivered after the chord was sent: its range tasks are already queued
+                    log.info("fan_out_already_dispatched")
+                    return
+                await set_status(db, document, blob, "processing")
+                await start_progress(db, document, blob, index_doc_id, n_pages)
                 await db.commit()
 
-                # 3. Run Ingestion
-                await ingest_document(file_path, doc_id)
+                # 3. Run Ingestion (once per blob, keyed by the blob's index document)
+                if fan_out:
+                    ranges = page_ranges(n_pages, settings.INGEST_RANGE_PAGES)
+                    header = group(
+                        ingest_range_task.s(
+                            doc_id, index_doc_id, document.owner_id, file_path, document.filename, start, end
+                        ).set(queue=MAIN_QUEUE)
+                        for start, end in ranges
+                    )
+                    callback = (
+                        finalize_document_task.s(doc_id, index_doc_id)
+                        .set(queue=PRIORITY_QUEUE)
+                        .on_error(ingest_failed_task.s(doc_id))
+                    )
+                    chord(header)(callback)
+                    # Marked only once the chord is queued: a task killed before this point is
+                    # redelivered and dispatches it (range tasks resume from their checkpoints)
+                    await get_redis().set(_fanout_key(doc_id), 1, ex=settings.INGEST_CHECKPOINT_TTL)
+                    log.info("processing_fanned_out", pages=n_pages, ranges=len(ranges))
+                    return
+
+                progress = IngestProgress(document, blob, index_doc_id, pages_total=n_pages)
+                checkpoint = await progress.load()
+                if checkpoint.next_page:
+                    await progress.report()
+                await ingest_document(
+                    file_path,
+                    index_doc_id,
+                    source=document.filename,
+                    checkpoint=checkpoint,
+                    on_checkpoint=progress.on_checkpoint,
+                )
 
-                # 4. Update status to indexed
-                document.status = "indexed"
+                # 4. Update status to indexed (for every document sharing the blob)
+                await finish_progress(db, document, blob, index_doc_id, progress.chunks)
+                await set_status(db, document, blob, "indexed")
                 await db.commit()
+                await progress.clear_checkpoint()
+
+                # 5. New content is searchable now: retire answers cached at upload time
+                await answer_cache.invalidate()
                 log.info("processing_completed")
                 
             except Exception as e:
                 log.exception("processing_failed", error=str(e))
-                # 5. Handle Failure
+                # Rebuild shared clients if the failure came from a broken connection
+                await asyncio.to_thread(resources.check)
+                # 6. Handle Failure (checkpoints are kept, so a retry resumes)
+                try:
+                    await get_redis().delete(_fanout_key(doc_id))
+                except Exception:
+                    pass
                 if document:
                     try:
-                        document.status = "failed"
-                        document.error_message = str(e)
+                        await set_status(db, document, blob, "failed", error=str(e))
                         await db.commit()
                     except Exception as db_e:
                         log.error("failed_to_save_error_status", error=str(db_e))
 
-    # Run async function in sync Celery task
-    async_to_sync(_process)()
+    # Run on the shared worker loop; the task (and its late ack) completes when it does
+    worker_loop.run(run_limited(_process()))
+
+@celery_app.task(bind=True, acks_late=True, max_retries=None)
+def ingest_range_task(self, doc_id: int, index_doc_id: int, owner_id: int, file_path: str, source: str, start: int, end: int):
+    """
+    Ingest pages [start, end) of a fanned-out document; returns the chunk IDs produced.
+    """
+    async def _process():
+        from app.core.logging import logger
+        log = logger.bind(task="ingest_range", doc_id=doc_id, start=start, end=end)
+        if not await acquire_user_slot(owner_id, self.request.id):
+            return None
+        try:
+            async with AsyncSessionLocal() as db:
+                document, blob = await load_document(db, doc_id)
+            progress = IngestProgress(document, blob, index_doc_id, range_start=start)
+            checkpoint = await progress.load()
+            if checkpoint.next_page:
+                await progress.report()
+            chunk_ids = await ingest_page_range(
+                file_path,
+                index_doc_id,
+                start,
+                end,
+                source=source,
+                checkpoint=checkpoint,
+                on_checkpoint=progress.on_checkpoint,
+            )
+            await progress.report()
+            # The chord result holds this range's chunk IDs from here on
+            await progress.clear_checkpoint()
+            log.info("range_completed", chunks=len(chunk_ids))
+            return chunk_ids
+        except Exception as e:
+            log.exception("range_failed", error=str(e))
+            await asyncio.to_thread(resources.check)
+            raise
+        finally:
+            await release_user_slot(owner_id, self.request.id)
+
+    chunk_ids = worker_loop.run(run_limited(_process()))
+    if chunk_ids is None:
+        # This user already has their share of workers busy: requeue behind other users' work
+        raise self.retry(countdown=settings.INGEST_FAIRNESS_RETRY_DELAY)
+    return chunk_ids
+
+@celery_app.task(acks_late=True)
+def finalize_document_task(results: List[List[str]], doc_id: int, index_doc_id: int):
+    """
+    Chord callback: drop chunks no range produced and mark the document indexed.
+    """
+    async def _process():
+        from app.core.logging import logger
+        log = logger.bind(task="finalize_document", doc_id=doc_id)
+        chunk_ids = [chunk_id for ids in results for chunk_id in ids]
+        deleted = await asyncio.to_thread(finalize_document, index_doc_id, chunk_ids)
+        async with AsyncSessionLocal() as db:
+            document, blob = await load_document(db, doc_id)
+            if document:
+                await finish_progress(db, document, blob, index_doc_id, len(chunk_ids))
+                await set_status(db, document, blob, "indexed")
+                await db.commit()
+        await get_redis().delete(_fanout_key(doc_id))
+        await answer_cache.invalidate()
+        log.info("processing_completed", chunks=len(chunk_ids), deleted=deleted)
+
+    worker_loop.run(run_limited(_process()))
+
+@celery_app.task
+def ingest_failed_task(request, exc, traceback, doc_id: int):
+    """
+    Chord error callback: a page range failed, so the document did not finish indexing.
+    The failed range keeps its checkpoint, so re-ingesting resumes it.
+    """
+    async def _process():
+        await get_redis().delete(_fanout_key(doc_id))
+        await mark_failed(doc_id, str(exc))
+
+    worker_loop.run(_process())
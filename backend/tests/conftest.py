@@ -0,0 +1,7 @@
+import os
+
+# Settings are read at import time; the services themselves are never contacted
+os.environ.setdefault("POSTGRES_USER", "test")
+os.environ.setdefault("POSTGRES_PASSWORD", "test")
+os.environ.setdefault("POSTGRES_DB", "test")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from app.rag import retrieval
+from app.rag.lexical import HybridResult
+from app.rag.resources import resources
+from app.rag.web_search import WebSearch, web_search
+
+
+class FakeProvider:
+    """Stand-in search provider: returns after `delay` seconds and counts its calls."""
+
+    source_name = "Fake Search"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.finished = threading.Event()
+
+    def run(self, query: str) -> str:
+        self.calls += 1
+        time.sleep(self.delay)
+        self.finished.set()
+        return f"results for {query}"
+
+
+@pytest.fixture
+def provider():
+    provider = FakeProvider()
+    resources.override("web_search", provider)
+    yield provider
+    resources.invalidate("web_search")
+
+
+def test_override_is_used_and_results_are_cached(provider):
+    search = WebSearch(timeout=1.0, cache_size=8, cache_ttl=60)
+
+    async def main():
+        first = await search.search("What is X?")
+        second = await search.search("  what is x ")
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == second == "results for What is X?"
+    assert provider.calls == 1
+    assert search.source_name() == "Fake Search"
+
+
+def test_timeout_returns_none_and_late_result_is_cached(provider):
+    provider.delay = 0.3
+    search = WebSearch(timeout=0.05, cache_size=8, cache_ttl=60)
+
+    async def main():
+        timed_out = await search.search("slow question")
+        await asyncio.sleep(0.4) # the provider call finishes after its caller gave up
+        cached = await search.search("slow question")
+        return timed_out, cached
+
+    timed_out, cached = asyncio.run(main())
+    assert timed_out is None
+    assert cached == "results for slow question"
+    assert provider.calls == 1
+
+
+def test_concurrent_identical_searches_share_one_call(provider):
+    provider.delay = 0.1
+    search = WebSearch(timeout=1.0, cache_size=8, cache_ttl=60)
+
+    async def main():
+        return await asyncio.gather(*(search.search("same question") for _ in range(5)))
+
+    assert asyncio.run(main()) == ["results for same question"] * 5
+    assert provider.calls == 1
+
+
+def test_deadline_runs_from_start(provider):
+    provider.delay = 0.3
+    search = WebSearch(timeout=0.1, cache_size=8, cache_ttl=60)
+
+    async def main():
+        task = search.start("started early")
+        await asyncio.sleep(0.15) # the caller only awaits it after the deadline
+        return await task
+
+    assert asyncio.run(main()) is None
+
+
+def test_abandoned_answer_cancels_speculative_search(provider, monkeypatch):
+    provider.delay = 0.2
+    resources.override("ranker", object())
+    started = []
+
+    def start(query):
+        task = WebSearch.start(web_search, query)
+        started.append(task)
+        return task
+
+    async def slow_rerank(query, passages):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(web_search, "start", start)
+    monkeypatch.setattr(retrieval.rerank_service, "rerank", slow_rerank)
+    # Weak vector relevance: the web search starts speculatively, alongside reranking
+    hybrid = HybridResult([Document(page_content="weak match")], agreed=False, vector_relevance=0.1)
+
+    async def main():
+        answer = retrieval.answer_stream("speculated question", hybrid, 1, None)
+        task = asyncio.ensure_future(answer.__anext__())
+        await asyncio.sleep(0.05)
+        task.cancel() # e.g. the client went away while reranking
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert len(started) == 1
+        await asyncio.wait(started, timeout=0.1)
+        assert started[0].cancelled()
+
+    try:
+        asyncio.run(main())
+    finally:
+        resources.invalidate("ranker")
+    assert provider.finished.wait(1.0) # the provider call itself still completes
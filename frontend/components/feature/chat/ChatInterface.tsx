@@ -18,6 +18,7 @@ import { useMutation } from '@tanstack/react-query';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 import { toast } from 'sonner';
+import { readEvents } from '@/lib/sse';
 
 interface Message {
     role: 'user' | 'assistant';
@@ -141,7 +142,7 @@ export function ChatInterface() {
         toast.success("Chat history downloaded.");
     };
 
-    // Custom Stream Handler for Raw Text
+    // Stream Handler for the chat event stream (see lib/sse.ts)
     const handleSendRaw = async () => {
         if (!input.trim() || isLoading) return;
 
@@ -169,67 +170,24 @@ export function ChatInterface() {
             });
 
             if (!response.body) return;
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
 
-            let buffer = "";
-            let hasReceivedMetadata = false;
-
-            while (true) {
-                const { value, done } = await reader.read();
-                if (done) break;
-                const chunk = decoder.decode(value, { stream: true });
+            const updateAssistant = (update: (msg: Message) => Message) => {
+                setMessages(prev => {
+                    const lastMsg = prev[prev.length - 1];
+                    if (lastMsg?.role !== 'assistant') return prev;
+                    return [...prev.slice(0, -1), update(lastMsg)];
+                });
+            };
 
-                if (!hasReceivedMetadata) {
-                    buffer += chunk;
-                    // Check for metadata boundary
-                    const splitIdx = buffer.indexOf('\n\n');
-                    if (splitIdx !== -1) {
-                        const jsonStr = buffer.substring(0, splitIdx);
-                        try {
-                            const data = JSON.parse(jsonStr);
-                            if (data.type === 'sources') {
-                                setMessages(prev => {
-                                    const newMsgs = [...prev];
-                                    const lastMsg = newMsgs[newMsgs.length - 1];
-                                    if (lastMsg.role === 'assistant') {
-                                        return [...newMsgs.slice(0, -1), { ...lastMsg, sources: data.data }];
-                                    }
-                                    return prev;
-                                });
-                            }
-                            hasReceivedMetadata = true;
-                            // Process remaining part of buffer as text
-                            const remaining = buffer.substring(splitIdx + 2);
-                            if (remaining) {
-                                setMessages(prev => {
-                                    const newMsgs = [...prev];
-                                    const lastMsg = newMsgs[newMsgs.length - 1];
-                                    if (lastMsg.role === 'assistant') {
-                                        return [...newMsgs.slice(0, -1), { ...lastMsg, content: lastMsg.content + remaining }];
-                                    }
-                                    return prev;
-                                });
-                            }
-                        } catch (e) {
-                            console.error("JSON Parse error", e);
-                            // If parse fails, assume it's just text? Or keep buffering? 
-                            // For now assuming broken JSON means we skip it or treat as text if it doesn't look like JSON
-                            hasReceivedMetadata = true; // Stop trying to parse JSON
-                        }
-                        buffer = ""; // Clear buffer
-                    }
-                    // Else keep buffering until we find \n\n
-                } else {
-                    // Metadata already received, just stream text
-                    setMessages(prev => {
-                        const newMsgs = [...prev];
-                        const lastMsg = newMsgs[newMsgs.length - 1];
-                        if (lastMsg.role === 'assistant') {
-                            return [...newMsgs.slice(0, -1), { ...lastMsg, content: lastMsg.content + chunk }];
-                        }
-                        return prev;
-                    });
+            for await (const { event, data } of readEvents(response.body)) {
+                if (event === 'sources') {
+                    updateAssistant(msg => ({ ...msg, sources: data }));
+                } else if (event === 'token') {
+                    updateAssistant(msg => ({ ...msg, content: msg.content + data.text }));
+                } else if (event === 'error') {
+                    toast.error(data.message || "Failed to generate a response.");
+                } else if (event === 'done') {
+                    break;
                 }
             }
         } catch (err: any) {
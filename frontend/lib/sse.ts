@@ -0,0 +1,49 @@
+export interface ServerSentEvent {
+    event: string;
+    id?: string;
+    data: any;
+}
+
+// Parses a text/event-stream body (as sent by the chat endpoint) into events.
+// Comment lines (heartbeats) are skipped; data is JSON.
+export async function* readEvents(body: ReadableStream<Uint8Array>): AsyncGenerator<ServerSentEvent> {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    try {
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.substring(0, boundary);
+                buffer = buffer.substring(boundary + 2);
+
+                let event = 'message';
+                let id: string | undefined;
+                const dataLines: string[] = [];
+                for (const line of frame.split('\n')) {
+                    if (!line || line.startsWith(':')) continue;
+                    const sep = line.indexOf(':');
+                    const field = sep === -1 ? line : line.substring(0, sep);
+                    const value = sep === -1 ? '' : line.substring(sep + 1).replace(/^ /, '');
+                    if (field === 'event') event = value;
+                    else if (field === 'id') id = value;
+                    else if (field === 'data') dataLines.push(value);
+                }
+                if (dataLines.length === 0) continue;
+
+                try {
+                    yield { event, id, data: JSON.parse(dataLines.join('\n')) };
+                } catch (e) {
+                    console.error("SSE parse error", e);
+                }
+            }
+        }
+    } finally {
+        reader.releaseLock();
+    }
+}
@@ -23,8 +23,10 @@ cd ..
 # Start Worker
 echo "Starting Celery Worker..."
 cd backend
-celery -A app.worker worker --loglevel=info &
+celery -A app.worker worker --loglevel=info -Q priority-queue,main-queue,celery &
 WORKER_PID=$!
+celery -A app.worker worker --loglevel=info -Q priority-queue -n priority@%h &
+PRIORITY_WORKER_PID=$!
 cd ..
 
 # Start Frontend
@@ -39,6 +41,6 @@ echo "Backend: http://localhost:8000/docs"
 echo "Frontend: http://localhost:3000"
 
 # Cleanup trap
-trap "kill $BACKEND_PID $WORKER_PID $FRONTEND_PID; docker-compose down" INT
+trap "kill $BACKEND_PID $WORKER_PID $PRIORITY_WORKER_PID $FRONTEND_PID; docker-compose down" INT
 
 wait